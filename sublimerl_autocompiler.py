@@ -28,8 +28,14 @@
 
 # imports
 import sublime, sublime_plugin
-import os, threading
-from sublimerl_core import SUBLIMERL, SublimErlProjectLoader
+import os, threading, Queue
+from sublimerl_core import SUBLIMERL, SublimErlProjectLoader, SublimErlPanel
+from sublimerl_includes import get_include_graph
+from sublimerl_beam_cache import SUBLIMERL_BEAM_CACHE
+from sublimerl_dialyzer import SUBLIMERL_DIALYZER_DAEMON
+
+# compile state, per project root
+SUBLIMERL_AUTOCOMPILES = {}
 
 
 # test runner
@@ -40,37 +46,138 @@ class SublimErlAutocompiler(SublimErlProjectLoader):
 		SublimErlProjectLoader.__init__(self, view)
 		# init
 		self.panel_name = 'sublimerl_autocompiler'
-		self.panel_buffer = ''
+		self.lock = threading.Lock()
+		self.generation = None
+		self.saved_paths = []
+		self.cancelled = False
+		# loader of the background dialyzer, built here on the main thread: it does not get cancelled by the next compile
+		self.dialyzer_loader = None
+		if SUBLIMERL.settings.get('dialyzer_background', False) == True: self.dialyzer_loader = SublimErlProjectLoader(view)
 		# setup panel
 		self.setup_panel()
 
 	def setup_panel(self):
-		self.panel = self.window.get_output_panel(self.panel_name)
-		self.panel.settings().set("syntax", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlAutocompile.hidden-tmLanguage"))
-		self.panel.settings().set("color_scheme", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlAutocompile.hidden-tmTheme"))
-
-	def update_panel(self):
-		if len(self.panel_buffer):
-			panel_edit = self.panel.begin_edit()
-			self.panel.insert(panel_edit, self.panel.size(), self.panel_buffer)
-			self.panel.end_edit(panel_edit)
-			self.panel.show(self.panel.size())
-			self.panel_buffer = ''
-			self.window.run_command("show_panel", {"panel": "output.%s" % self.panel_name})
+		self.panel = SublimErlPanel(self.window, self.panel_name, 'SublimErlAutocompile')
 
 	def hide_panel(self):
-		self.window.run_command("hide_panel")
+		self.panel.hide()
 
 	def log(self, text):
-		self.panel_buffer += text.encode('utf-8')
-		sublime.set_timeout(self.update_panel, 0)
+		# only the latest compile is shown
+		if self.cancelled: return
+		self.panel.write(text)
+
+	def schedule(self):
+		# debounce: saves of the same project are compiled together once no save happened for compile_delay ms
+		global SUBLIMERL_AUTOCOMPILES
+		if self.project_root == None: return
+		if not SUBLIMERL_AUTOCOMPILES.has_key(self.project_root):
+			SUBLIMERL_AUTOCOMPILES[self.project_root] = {'generation': 0, 'saved_paths': [], 'autocompiler': None}
+		state = SUBLIMERL_AUTOCOMPILES[self.project_root]
+		state['generation'] += 1
+		self.generation = state['generation']
+		saved_path = os.path.abspath(self.view.file_name())
+		if saved_path not in state['saved_paths']: state['saved_paths'].append(saved_path)
+		sublime.set_timeout(self.start, SUBLIMERL.settings.get('compile_delay', 300))
+
+	def start(self):
+		global SUBLIMERL_AUTOCOMPILES
+		state = SUBLIMERL_AUTOCOMPILES[self.project_root]
+		# a newer save has been scheduled
+		if state['generation'] != self.generation: return
+		# supersede the in-flight compile, and compile its files again
+		running = state['autocompiler']
+		if running != None:
+			running.cancel()
+			for saved_path in running.saved_paths:
+				if saved_path not in state['saved_paths']: state['saved_paths'].append(saved_path)
+		self.saved_paths = state['saved_paths']
+		state['saved_paths'] = []
+		state['autocompiler'] = self
+		# compile
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.compile()
+				sublime.set_timeout(this.on_compile_ended, 0)
+		SublimErlThread().start()
+
+	def cancel(self):
+		self.cancelled = True
+		self.kill_processes()
+
+	def on_compile_ended(self):
+		global SUBLIMERL_AUTOCOMPILES
+		state = SUBLIMERL_AUTOCOMPILES[self.project_root]
+		if state['autocompiler'] == self: state['autocompiler'] = None
 
 	def compile(self):
-		retcode, data = self.compile_source(skip_deps=True)
+		# keep the include graph up to date
+		include_graph = get_include_graph(self.project_root)
+		for saved_path in self.saved_paths:
+			if os.path.splitext(saved_path)[1] in ('.erl', '.hrl') or os.path.basename(saved_path) == 'rebar.config': include_graph.update_file(saved_path)
+		# get modules to compile
+		module_paths = []
+		for saved_path in self.saved_paths:
+			if os.path.splitext(saved_path)[1] == '.hrl':
+				# rebar only compiles the modules in src
+				dependent_paths = [p for p in include_graph.get_dependent_modules(saved_path) if self.is_src_module(p)]
+			else:
+				dependent_paths = [saved_path]
+			for module_path in dependent_paths:
+				if module_path not in module_paths: module_paths.append(module_path)
+
+		if False in [self.can_compile_module(p) for p in module_paths]:
+			# .app.src, rebar.config or a module that rebar needs to build
+			retcode, data = self.compile_source(skip_deps=True)
+			if retcode != 0:
+				self.log(data)
+				return
+		elif self.compile_modules(module_paths) == False:
+			return
+		if not self.cancelled:
+			sublime.set_timeout(self.hide_panel, 0)
+			# analyze in the background
+			if self.dialyzer_loader != None: SUBLIMERL_DIALYZER_DAEMON.schedule(self.dialyzer_loader, [p for p in module_paths if p.endswith('.erl')])
+
+	def is_src_module(self, module_path):
+		app_root = get_include_graph(self.project_root).get_app_root(module_path)
+		return app_root != None and module_path.startswith(os.path.join(app_root, 'src') + os.sep)
+
+	def can_compile_module(self, module_path):
+		if os.path.splitext(module_path)[1] != '.erl' or not self.is_src_module(module_path): return False
+		# the app must have been compiled by rebar at least once
+		ebin_path = os.path.join(get_include_graph(self.project_root).get_app_root(module_path), 'ebin')
+		return os.path.isdir(ebin_path) and True in [f.endswith('.app') for f in os.listdir(ebin_path)]
+
+	def compile_modules(self, module_paths):
+		# compile modules in a bounded pool, reporting errors as each module finishes
+		queue = Queue.Queue()
+		for module_path in module_paths: queue.put(module_path)
+		self.compile_failed = False
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				while True:
+					try:
+						module_path = queue.get_nowait()
+					except Queue.Empty:
+						return
+					if this.cancelled: return
+					this.compile_src_module(module_path)
+		workers = [SublimErlThread() for i in range(min(len(module_paths), SUBLIMERL.settings.get('compile_workers', 4)))]
+		for worker in workers: worker.start()
+		for worker in workers: worker.join()
+		return not (self.compile_failed or self.cancelled)
+
+	def compile_src_module(self, module_path):
+		app_root = get_include_graph(self.project_root).get_app_root(module_path)
+		retcode, data = SUBLIMERL_BEAM_CACHE.compile_module(self, module_path, os.path.join(app_root, 'ebin'), app_root=app_root)
 		if retcode != 0:
+			self.lock.acquire()
+			self.compile_failed = True
 			self.log(data)
-		else:
-			sublime.set_timeout(self.hide_panel, 0)
+			self.lock.release()
 
 # listener
 class SublimErlAutocompilerListener(sublime_plugin.EventListener):
@@ -80,13 +187,16 @@ class SublimErlAutocompilerListener(sublime_plugin.EventListener):
 		# check init successful
 		if SUBLIMERL.initialized == False: return
 		# ensure context matches
-		caret = view.sel()[0].a
-		if not ('source.erlang' in view.scope_name(caret) and sublime.platform() != 'windows'): return
+		if not self.is_compilable(view): return
 		# init
 		autocompiler = SublimErlAutocompiler(view)
-		# compile saved file & reload completions
-		class SublimErlThread(threading.Thread):
-			def run(self):
-				# compile
-				autocompiler.compile()
-		SublimErlThread().start()
+		# compile saved file
+		autocompiler.schedule()
+
+	def is_compilable(self, view):
+		if sublime.platform() == 'windows' or view.file_name() == None: return False
+		# erlang sources, or files that affect how rebar compiles them
+		filename = os.path.basename(view.file_name())
+		if filename == 'rebar.config' or filename.endswith('.app.src'): return True
+		caret = view.sel()[0].a
+		return 'source.erlang' in view.scope_name(caret)
@@ -0,0 +1,137 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+# imports
+import os, shutil, hashlib, threading
+from sublimerl_core import SUBLIMERL
+from sublimerl_includes import get_include_graph
+
+
+# content-addressed cache of compiled beams
+class SublimErlBeamCache():
+
+	def __init__(self):
+		# init
+		self.lock = threading.Lock()
+
+	def get_beams_path(self):
+		return os.path.join(SUBLIMERL.cache_path, 'beams')
+
+	def compile_module(self, loader, module_path, out_dir, options=[], app_root=None):
+		# restore the beam from cache if the same source was already compiled with the same options
+		if SUBLIMERL.settings.get('compile_cache', True) == False: return loader.compile_module(module_path, out_dir, options, app_root)
+		# the key cannot cover includes that are not found
+		if get_include_graph(loader.project_root).has_unresolved_includes(module_path): return loader.compile_module(module_path, out_dir, options, app_root)
+		if app_root == None: app_root = loader.test_root
+		module_path = os.path.abspath(module_path)
+		beam_path = os.path.join(out_dir, "%s.beam" % os.path.splitext(os.path.basename(module_path))[0])
+		key = self.get_key(loader.project_root, app_root, module_path, out_dir, options)
+		if self.restore(key, beam_path) == True: return (0, '')
+		# keep the previous beam in case the compile fails, but replace an eventual hardlink to the cache with a copy so that the entry does not get overwritten
+		if SUBLIMERL.settings.get('compile_cache_hardlink', False) == True and os.path.exists(beam_path): self.unlink_beam(beam_path)
+		retcode, data = loader.compile_module(module_path, out_dir, options, app_root)
+		if retcode == 0 and os.path.exists(beam_path): self.store(key, beam_path)
+		return (retcode, data)
+
+	def get_key(self, project_root, app_root, module_path, out_dir, options):
+		# hash of the source, of its transitive includes and of everything that defines the compile options
+		h = hashlib.sha1()
+		h.update(SUBLIMERL.get_otp_fingerprint())
+		h.update(os.path.basename(out_dir))
+		h.update(' '.join(options))
+		for config_path in (os.path.join(project_root, 'rebar.config'), os.path.join(app_root, 'rebar.config')):
+			h.update(self.read_file(config_path))
+		h.update(self.read_file(module_path))
+		for include_path in sorted(get_include_graph(project_root).get_transitive_includes(module_path)):
+			h.update(include_path)
+			h.update(self.read_file(include_path))
+		return h.hexdigest()
+
+	def read_file(self, filepath):
+		if not os.path.exists(filepath): return ''
+		f = open(filepath, 'rb')
+		contents = f.read()
+		f.close()
+		return contents
+
+	def get_entry_path(self, key):
+		return os.path.join(self.get_beams_path(), key[:2], "%s.beam" % key)
+
+	def restore(self, key, beam_path):
+		entry_path = self.get_entry_path(key)
+		if not os.path.exists(entry_path): return False
+		# mark as recently used
+		os.utime(entry_path, None)
+		if os.path.exists(beam_path): os.remove(beam_path)
+		if SUBLIMERL.settings.get('compile_cache_hardlink', False) == True:
+			try:
+				os.link(entry_path, beam_path)
+				return True
+			except OSError:
+				pass
+		shutil.copyfile(entry_path, beam_path)
+		return True
+
+	def unlink_beam(self, beam_path):
+		temp_path = "%s.%d.tmp" % (beam_path, threading.current_thread().ident)
+		shutil.copyfile(beam_path, temp_path)
+		os.rename(temp_path, beam_path)
+
+	def store(self, key, beam_path):
+		entry_path = self.get_entry_path(key)
+		if not os.path.exists(os.path.dirname(entry_path)): os.makedirs(os.path.dirname(entry_path))
+		# write atomically, concurrent compiles may store the same entry
+		temp_path = "%s.%d.tmp" % (entry_path, threading.current_thread().ident)
+		shutil.copyfile(beam_path, temp_path)
+		os.rename(temp_path, entry_path)
+		self.evict()
+
+	def evict(self):
+		# remove least recently used entries until the cache fits in its max size
+		max_size = SUBLIMERL.settings.get('compile_cache_max_size', 100) * 1024 * 1024
+		self.lock.acquire()
+		try:
+			entries = []
+			total_size = 0
+			for root, dirnames, filenames in os.walk(self.get_beams_path()):
+				for filename in filenames:
+					if filename.endswith('.tmp'): continue
+					entry_path = os.path.join(root, filename)
+					stat = os.stat(entry_path)
+					entries.append((stat.st_mtime, stat.st_size, entry_path))
+					total_size += stat.st_size
+			entries.sort()
+			while total_size > max_size and len(entries) > 0:
+				mtime, size, entry_path = entries.pop(0)
+				os.remove(entry_path)
+				total_size -= size
+		finally:
+			self.lock.release()
+
+# initialize
+SUBLIMERL_BEAM_CACHE = SublimErlBeamCache()
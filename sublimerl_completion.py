@@ -28,22 +28,134 @@
 
 # imports
 import sublime, sublime_plugin
-import os, threading, pickle, json, re
+import os, threading, pickle, cPickle, json, re
 from sublimerl_core import SUBLIMERL, SublimErlProjectLoader
 
 SUBLIMERL_COMPLETIONS = {
 	'erlang_libs': {
 		'completions': {},
+		'searches': [],
+		'definitions': {},
 		'load_in_progress': False,
 		'rebuilt': False
 	},
 	'current_project': {
 		'completions': {},
+		'searches': [],
+		'definitions': {},
+		'calls': {},
+		'usages': {},
+		'trigrams': {},
+		'trigram_files': {},
 		'load_in_progress': False,
 		'rebuild_in_progress': False
 	}
 }
 
+# indexes, loaded synchronously from file if they have not been yet
+class SublimErlIndexes():
+
+	def get(self, code_type, index_type):
+		global SUBLIMERL_COMPLETIONS
+		if len(SUBLIMERL_COMPLETIONS[code_type][index_type]) == 0:
+			index = self.load(code_type, index_type)
+			if index != None: SUBLIMERL_COMPLETIONS[code_type][index_type] = index
+		return SUBLIMERL_COMPLETIONS[code_type][index_type]
+
+	def load(self, code_type, index_type):
+		# index as stored on file, None if it has not been generated
+		filename = {'erlang_libs': 'Erlang-Libs', 'current_project': 'Current-Project'}[code_type]
+		index_filepath = os.path.join(SUBLIMERL.completions_path, "%s.%s" % (filename, index_type))
+		if not os.path.exists(index_filepath): return None
+		f = open(index_filepath, 'rb')
+		index = pickle.load(f)
+		f.close()
+		return index
+
+	def get_calls(self):
+		# calls are loaded through set_calls, so that the usages index gets built along
+		if len(SUBLIMERL_COMPLETIONS['current_project']['calls']) == 0:
+			calls = self.load('current_project', 'calls')
+			if calls != None: self.set_calls(calls)
+		return SUBLIMERL_COMPLETIONS['current_project']['calls']
+
+	def get_usages(self, function):
+		# (filepath, line) of the calls to the (module, function, arity) in the project
+		self.get_calls()
+		return SUBLIMERL_COMPLETIONS['current_project']['usages'].get(function, [])
+
+	def set_calls(self, calls):
+		# update the usages index with the modules whose calls have changed only
+		global SUBLIMERL_COMPLETIONS
+		old_calls = SUBLIMERL_COMPLETIONS['current_project']['calls']
+		usages = SUBLIMERL_COMPLETIONS['current_project']['usages']
+		for module_name in old_calls.keys():
+			if calls.get(module_name) == old_calls[module_name]: continue
+			filepath, module_calls = old_calls[module_name]
+			for function, line in module_calls:
+				usages[function].remove((filepath, line))
+				if len(usages[function]) == 0: del usages[function]
+		for module_name in calls.keys():
+			if old_calls.get(module_name) == calls[module_name]: continue
+			filepath, module_calls = calls[module_name]
+			for function, line in module_calls:
+				usages.setdefault(function, []).append((filepath, line))
+		SUBLIMERL_COMPLETIONS['current_project']['calls'] = calls
+
+	def get_trigram_candidates(self, text):
+		# files that contain all the trigrams of text, None if text is too short to narrow them
+		if len(SUBLIMERL_COMPLETIONS['current_project']['trigrams']) == 0: self.load_trigrams()
+		if len(text) < 3: return None
+		trigram_files = SUBLIMERL_COMPLETIONS['current_project']['trigram_files']
+		candidates = None
+		for trigram in set([text[i:i + 3] for i in range(0, len(text) - 2)]):
+			filepaths = trigram_files.get(trigram, set())
+			if candidates == None: candidates = set(filepaths)
+			else: candidates &= filepaths
+			if len(candidates) == 0: break
+		return candidates
+
+	def load_trigrams(self):
+		# the manifest of the trigram index: {filepath: (mtime, shard name)}
+		trigrams_filepath = os.path.join(SUBLIMERL.completions_path, "Current-Project.trigrams")
+		if not os.path.exists(trigrams_filepath): return
+		f = open(trigrams_filepath, 'rb')
+		try:
+			manifest = cPickle.load(f)
+		finally:
+			f.close()
+		self.set_trigrams(manifest, "%s.d" % trigrams_filepath)
+
+	def set_trigrams(self, manifest, shards_path):
+		# update the trigram to files index with the files that have changed only, reading their shards
+		global SUBLIMERL_COMPLETIONS
+		old_files = SUBLIMERL_COMPLETIONS['current_project']['trigrams']
+		trigram_files = SUBLIMERL_COMPLETIONS['current_project']['trigram_files']
+		files = {}
+		for filepath, (mtime, shard_name) in manifest.items():
+			# manifests of the previous format hold the trigrams themselves, they get rewritten by the next generation
+			if not isinstance(shard_name, str): continue
+			if old_files.has_key(filepath) and old_files[filepath][0] == mtime:
+				files[filepath] = old_files[filepath]
+				continue
+			shard_filepath = os.path.join(shards_path, shard_name)
+			if not os.path.exists(shard_filepath): continue
+			f = open(shard_filepath, 'rb')
+			data = f.read()
+			f.close()
+			files[filepath] = (mtime, frozenset([data[i:i + 3] for i in range(0, len(data), 3)]))
+		for filepath in old_files.keys():
+			if files.get(filepath) is old_files[filepath]: continue
+			for trigram in old_files[filepath][1]:
+				trigram_files[trigram].discard(filepath)
+				if len(trigram_files[trigram]) == 0: del trigram_files[trigram]
+		for filepath in files.keys():
+			if old_files.get(filepath) is files[filepath]: continue
+			for trigram in files[filepath][1]:
+				trigram_files.setdefault(trigram, set()).add(filepath)
+		SUBLIMERL_COMPLETIONS['current_project']['trigrams'] = files
+
+
 # erlang module name completions
 class SublimErlModuleNameCompletions():
 
@@ -124,6 +236,29 @@ class SublimErlCompletions(SublimErlProjectLoader):
 					f.close()
 					# set
 					SUBLIMERL_COMPLETIONS[code_type]['completions'] = completions
+				# load function searches
+				searches_filepath = os.path.join(SUBLIMERL.plugin_path, "completion", "%s.searches" % this.get_completion_filename(code_type))
+				if os.path.exists(searches_filepath):
+					f = open(searches_filepath, 'r')
+					searches = pickle.load(f)
+					f.close()
+					SUBLIMERL_COMPLETIONS[code_type]['searches'] = searches
+				# load function definitions
+				definitions_filepath = os.path.join(SUBLIMERL.plugin_path, "completion", "%s.definitions" % this.get_completion_filename(code_type))
+				if os.path.exists(definitions_filepath):
+					f = open(definitions_filepath, 'rb')
+					definitions = pickle.load(f)
+					f.close()
+					SUBLIMERL_COMPLETIONS[code_type]['definitions'] = definitions
+				# load function calls
+				calls_filepath = os.path.join(SUBLIMERL.plugin_path, "completion", "%s.calls" % this.get_completion_filename(code_type))
+				if code_type == 'current_project' and os.path.exists(calls_filepath):
+					f = open(calls_filepath, 'rb')
+					calls = pickle.load(f)
+					f.close()
+					SublimErlIndexes().set_calls(calls)
+				# load trigrams of the files that changed
+				if code_type == 'current_project': SublimErlIndexes().load_trigrams()
 
 				# release lock
 				SUBLIMERL_COMPLETIONS[code_type]['load_in_progress'] = False
@@ -151,15 +286,13 @@ class SublimErlCompletions(SublimErlProjectLoader):
 					f = open(dirinfo_path, 'rb')
 					erlang_libs = pickle.load(f)
 					f.close()
-					if current_erlang_libs == erlang_libs:
+					if current_erlang_libs == erlang_libs and os.path.exists("%s.searches" % dest_file_base) and os.path.exists("%s.definitions" % dest_file_base):
 						# same erlang libs, do not regenerate
 						return
 				# different erlang libs -> regenerate
 				this.status("Regenerating Erlang lib completions...")
-				# set cwd
-				os.chdir(SUBLIMERL.support_path)
 				# start gen
-				this.execute_os_command("python sublimerl_libparser.py %s %s" % (this.shellquote(SUBLIMERL.erlang_libs_path), this.shellquote(dest_file_base)))
+				this.execute_os_command("python %s %s %s" % (this.shellquote(os.path.join(SUBLIMERL.support_path, 'sublimerl_libparser.py')), this.shellquote(SUBLIMERL.erlang_libs_path), this.shellquote(dest_file_base)))
 				# rename file to .full
 				os.rename("%s.sublime-completions" % dest_file_base, "%s.sublime-completions.full" % dest_file_base)
 				# save dir information
@@ -189,10 +322,9 @@ class SublimErlCompletions(SublimErlProjectLoader):
 				this.status("Regenerating Project completions...")
 				# get dir
 				dest_file_base = os.path.join(SUBLIMERL.completions_path, "Current-Project")
-				# set cwd
-				os.chdir(SUBLIMERL.support_path)
 				# start gen
-				this.execute_os_command("python sublimerl_libparser.py %s %s" % (this.shellquote(this.project_root), this.shellquote(dest_file_base)))
+				this.execute_os_command("python %s %s %s" % (this.shellquote(os.path.join(SUBLIMERL.support_path, 'sublimerl_libparser.py')), this.shellquote(this.project_root), this.shellquote(dest_file_base)))
+				this.execute_os_command("python %s trigrams %s %s" % (this.shellquote(os.path.join(SUBLIMERL.support_path, 'sublimerl_libparser.py')), this.shellquote(this.project_root), this.shellquote(dest_file_base)))
 				# release lock
 				SUBLIMERL_COMPLETIONS['current_project']['rebuild_in_progress'] = False
 				# trigger event to reload completions
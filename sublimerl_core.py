@@ -31,7 +31,7 @@ SUBLIMERL_VERSION = '0.5.1'
 
 # imports
 import sublime, sublime_plugin
-import os, subprocess, re
+import os, subprocess, re, hashlib, signal, threading, time
 
 # plugin initialized (Sublime might need to be restarted if some env configs / preferences change)
 class SublimErlGlobal():
@@ -44,16 +44,14 @@ class SublimErlGlobal():
 		self.plugin_path = None
 		self.completions_path = None
 		self.support_path = None
+		self.cache_path = None
 
 		self.erl_path = None
 		self.escript_path = None
 		self.rebar_path = None
 		self.dialyzer_path = None
 		self.erlang_libs_path = None
-
-		self.last_test = None
-		self.last_test_type = None
-		self.test_in_progress = False
+		self.otp_fingerprint = None
 
 		self.env = None
 		self.settings = None
@@ -143,6 +141,7 @@ class SublimErlGlobal():
 		self.plugin_path = os.path.join(sublime.packages_path(), 'SublimErl')
 		self.completions_path = os.path.join(self.plugin_path, "completion")
 		self.support_path = os.path.join(self.plugin_path, "support")
+		self.cache_path = os.path.join(self.plugin_path, "cache")
 
 		return True
 
@@ -173,6 +172,37 @@ class SublimErlGlobal():
 			m = re.match(r"^\s*-\s*module\s*\(\s*([a-zA-Z0-9_]+)\s*\)\s*\.", view.substr(module_region))
 			return m.group(1)
 
+	def get_function_at(self, view, point):
+		# (module, function, arity) of the call or function reference at point
+		# module is None for local calls, arity is None if it cannot be determined
+		line_region = view.line(point)
+		line = view.substr(line_region)
+		column = point - line_region.begin()
+		for m in re.finditer(r"(?:\b([a-z][a-zA-Z0-9_]*)\s*:\s*)?\b([a-z][a-zA-Z0-9_]*)\s*(?:(\()|/\s*(\d+))", line):
+			if column < m.start() or column > m.end(2): continue
+			if m.group(4) != None: return (m.group(1), m.group(2), int(m.group(4)))
+			# count the arguments of the call
+			start = line_region.begin() + m.start(3)
+			code = self.strip_comments(view.substr(sublime.Region(start, min(view.size(), start + 10000))))
+			return (m.group(1), m.group(2), self.count_arguments(code))
+
+	def count_arguments(self, code):
+		# count the arguments between the parenthesis that starts code and its closing one
+		depth = 0
+		arguments = 0
+		regex = re.compile(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|\$\\?.|<<|>>|[()\[\]{},]|\b(?:case|begin|receive|if|try|end)\b|\bfun(?=\s*\()", re.DOTALL)
+		for m in regex.finditer(code):
+			token = m.group(0)
+			if token in ('(', '[', '{', '<<', 'case', 'begin', 'receive', 'if', 'try', 'fun'):
+				depth += 1
+			elif token in (')', ']', '}', '>>', 'end'):
+				depth -= 1
+				if depth == 0:
+					if len(code[1:m.start()].strip()) == 0: return 0
+					return arguments + 1
+			elif token == ',' and depth == 1:
+				arguments += 1
+
 	def get_exe_path(self, name):
 		retcode, data = self.execute_os_command('which %s' % name)
 		data = data.strip()
@@ -181,12 +211,18 @@ class SublimErlGlobal():
 
 	def set_erlang_libs_path(self):
 		# run escript to get erlang lib path
-		os.chdir(self.support_path)
-		escript_command = "sublimerl_utility.erl lib_dir"
+		escript_command = "%s lib_dir" % self.shellquote(os.path.join(self.support_path, 'sublimerl_utility.erl'))
 		retcode, data = self.execute_os_command('%s %s' % (self.escript_path, escript_command))
 		self.erlang_libs_path = data
 		return self.erlang_libs_path != ''
 
+	def get_otp_fingerprint(self):
+		# hash of the installed erlang lib versions
+		if self.otp_fingerprint == None:
+			erlang_libs = sorted([name for name in os.listdir(self.erlang_libs_path) if os.path.isdir(os.path.join(self.erlang_libs_path, name))])
+			self.otp_fingerprint = hashlib.sha1('\n'.join(erlang_libs)).hexdigest()
+		return self.otp_fingerprint
+
 	def set_completion_skip_erlang_libs(self):
 		self.completion_skip_erlang_libs = self.settings.get('completion_skip_erlang_libs', [])
 
@@ -204,6 +240,99 @@ class SublimErlGlobal():
 # initialize
 SUBLIMERL = SublimErlGlobal()
 
+# full logs of the output panels, by path: one handle per window and panel
+SUBLIMERL_PANEL_LOGS = {}
+SUBLIMERL_PANEL_LOGS_LOCK = threading.Lock()
+
+
+# output panel: batches writes at a capped rate and bounds the retained output, spilling the full log to disk
+class SublimErlPanel():
+
+	def __init__(self, window, name, theme):
+		# init
+		self.window = window
+		self.name = name
+		self.buffer = []
+		self.buffer_size = 0
+		self.flush_scheduled = False
+		self.last_flush = 0
+		self.lock = threading.Lock()
+
+		self.refresh_interval = SUBLIMERL.settings.get('panel_refresh_interval', 100)
+		self.max_size = SUBLIMERL.settings.get('panel_max_size', 500000)
+
+		# setup panel
+		self.panel = window.get_output_panel(name)
+		self.panel.settings().set("syntax", os.path.join(SUBLIMERL.plugin_path, "theme", "%s.hidden-tmLanguage" % theme))
+		self.panel.settings().set("color_scheme", os.path.join(SUBLIMERL.plugin_path, "theme", "%s.hidden-tmTheme" % theme))
+
+		# full log
+		logs_path = os.path.join(SUBLIMERL.cache_path, 'logs')
+		if not os.path.exists(logs_path): os.makedirs(logs_path)
+		self.log_path = os.path.join(logs_path, "%s.%s.log" % (name, window.id()))
+		self.log_file = self.open_log()
+
+	def open_log(self):
+		# reuse the handle of the previous panels, so that they do not leak and that a writer still in flight does not clobber the log
+		SUBLIMERL_PANEL_LOGS_LOCK.acquire()
+		try:
+			if SUBLIMERL_PANEL_LOGS.has_key(self.log_path):
+				log_file = SUBLIMERL_PANEL_LOGS[self.log_path]
+				log_file.seek(0)
+				log_file.truncate()
+			else:
+				log_file = open(self.log_path, 'wb')
+				SUBLIMERL_PANEL_LOGS[self.log_path] = log_file
+			return log_file
+		finally:
+			SUBLIMERL_PANEL_LOGS_LOCK.release()
+
+	def write(self, text):
+		if isinstance(text, unicode): text = text.encode('utf-8')
+		self.lock.acquire()
+		try:
+			self.log_file.write(text)
+			self.buffer.append(text)
+			self.buffer_size += len(text)
+			# the panel would only retain the tail of a large pending buffer anyway
+			if self.buffer_size > 2 * self.max_size:
+				self.buffer = [''.join(self.buffer)[-self.max_size:]]
+				self.buffer_size = self.max_size
+			if self.flush_scheduled == False:
+				self.flush_scheduled = True
+				delay = self.refresh_interval - int((time.time() - self.last_flush) * 1000)
+				sublime.set_timeout(self.flush, max(0, delay))
+		finally:
+			self.lock.release()
+
+	def flush(self):
+		# get pending output
+		self.lock.acquire()
+		try:
+			text = ''.join(self.buffer)
+			self.buffer = []
+			self.buffer_size = 0
+			self.flush_scheduled = False
+			self.last_flush = time.time()
+			self.log_file.flush()
+		finally:
+			self.lock.release()
+		if len(text) == 0: return
+		# insert in a single edit
+		panel_edit = self.panel.begin_edit()
+		self.panel.insert(panel_edit, self.panel.size(), text)
+		if self.panel.size() > self.max_size:
+			# drop the oldest lines
+			head = sublime.Region(0, self.panel.full_line(self.panel.size() - self.max_size).end())
+			self.panel.erase(panel_edit, head)
+			self.panel.insert(panel_edit, 0, "[... output truncated, full log in %s ...]\n" % self.log_path)
+		self.panel.end_edit(panel_edit)
+		self.panel.show(self.panel.size())
+		self.window.run_command("show_panel", {"panel": "output.%s" % self.name})
+
+	def hide(self):
+		self.window.run_command("hide_panel")
+
 
 # project loader
 class SublimErlProjectLoader():
@@ -213,6 +342,7 @@ class SublimErlProjectLoader():
 		self.view = view
 		self.window = view.window()
 		self.status_buffer = ''
+		self.processes = []
 
 		self.erlang_module_name = None
 		self.project_root = None
@@ -256,7 +386,10 @@ class SublimErlProjectLoader():
 
 	def set_app_name(self):
 		# get app file
+		if self.test_root == None: return
 		src_path = os.path.join(self.test_root, 'src')
+		# an umbrella root has no sources of its own
+		if not os.path.isdir(src_path): return
 		for f in os.listdir(src_path):
 			if f.endswith('.app.src'):
 				app_file_path = os.path.join(src_path, f)
@@ -293,28 +426,55 @@ class SublimErlProjectLoader():
 		retcode, data = self.execute_os_command('%s compile %s' % (SUBLIMERL.rebar_path, options), dir_type='project', block=True, log=False)
 		return (retcode, data)
 
+	def compile_module(self, module_path, out_dir, options=[], app_root=None):
+		# compile a single module to out_dir, using the erl_opts of the project's rebar.config
+		if app_root == None: app_root = self.test_root
+		compiler_path = os.path.join(SUBLIMERL.support_path, 'sublimerl_compiler.erl')
+		os_cmd = '%s %s %s %s %s' % (SUBLIMERL.escript_path, self.shellquote(compiler_path), self.shellquote(self.project_root), self.shellquote(app_root), self.shellquote(out_dir))
+		if len(options) > 0: os_cmd += ' %s' % ' '.join(options)
+		os_cmd += ' %s' % self.shellquote(module_path)
+		retcode, data = self.execute_os_command(os_cmd, dir_type='test', block=True, log=False)
+		return (retcode, data)
+
 	def shellquote(self, s):
 		return SUBLIMERL.shellquote(s)
 
-	def execute_os_command(self, os_cmd, dir_type=None, block=False, log=True):
-		# set dir
-		if dir_type == 'project': os.chdir(self.project_root)
-		elif dir_type == 'test': os.chdir(self.test_root)
+	def execute_os_command(self, os_cmd, dir_type=None, block=False, log=True, parser=None):
+		# set dir, per process: commands of different projects run concurrently
+		cwd = None
+		if dir_type == 'project': cwd = self.project_root
+		elif dir_type == 'test': cwd = self.test_root
 
-		if log == True: self.log("%s$ %s\n\n" % (os.getcwd(), os_cmd))
+		if log == True: self.log("%s$ %s\n\n" % (cwd or os.getcwd(), os_cmd))
 
-		# start proc
+		# start proc, in its own process group so that it can be killed with its children
 		current_env = self.get_test_env()
-		p = subprocess.Popen(os_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, env=current_env)
-		if block == True:
-			stdout, stderr = p.communicate()
-			return (p.returncode, stdout)
-		else:
-			stdout = []
-			for line in p.stdout:
-				self.log(line)
-				stdout.append(line)
-			return (p.returncode, ''.join(stdout))
+		p = subprocess.Popen(os_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, env=current_env, cwd=cwd, preexec_fn=os.setsid)
+		self.processes.append(p)
+		try:
+			if block == True:
+				stdout, stderr = p.communicate()
+				return (p.returncode, stdout)
+			else:
+				# stream the output: with a parser, only the output it keeps is returned
+				stdout = []
+				for line in iter(p.stdout.readline, ''):
+					self.log(line)
+					if parser != None: parser.feed(line)
+					else: stdout.append(line)
+				p.wait()
+				if parser != None: return (p.returncode, parser.get_output())
+				return (p.returncode, ''.join(stdout))
+		finally:
+			self.processes.remove(p)
+
+	def kill_processes(self):
+		# kill running commands
+		for p in list(self.processes):
+			try:
+				os.killpg(p.pid, signal.SIGTERM)
+			except OSError:
+				pass
 
 
 # common text command class
@@ -0,0 +1,282 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+
+# imports
+import sublime, sublime_plugin
+import os, re, subprocess, hashlib, pickle, threading
+from sublimerl_core import SUBLIMERL, SublimErlProjectLoader
+from sublimerl_includes import get_include_graph
+from sublimerl_beam_cache import SUBLIMERL_BEAM_CACHE
+from sublimerl_test_parsers import SublimErlDialyzerOutputParser
+
+# project plts, by project root
+SUBLIMERL_PLTS = {}
+
+
+# dialyzer plt of a project: the OTP apps from the settings and the deps, updated when their beams change
+class SublimErlPlt():
+
+	def __init__(self, project_root):
+		# init
+		self.project_root = project_root
+		self.lock = threading.Lock()
+
+	def get_plt_path(self):
+		apps = SUBLIMERL.settings.get('dialyzer_plt_apps', ['erts', 'kernel', 'stdlib'])
+		key = hashlib.sha1("%s\n%s" % (SUBLIMERL.get_otp_fingerprint(), ' '.join(sorted(apps)))).hexdigest()
+		return os.path.join(SUBLIMERL.cache_path, 'plts', hashlib.sha1(self.project_root).hexdigest(), "%s.plt" % key)
+
+	def get_deps(self):
+		# ebin path -> (version, signature of its beams) of every dep
+		deps = {}
+		deps_path = os.path.join(self.project_root, 'deps')
+		if not os.path.isdir(deps_path): return deps
+		for name in sorted(os.listdir(deps_path)):
+			ebin_path = os.path.join(deps_path, name, 'ebin')
+			if not os.path.isdir(ebin_path): continue
+			version = None
+			signature = hashlib.sha1()
+			for filename in sorted(os.listdir(ebin_path)):
+				filepath = os.path.join(ebin_path, filename)
+				if filename.endswith('.app'):
+					f = open(filepath, 'r')
+					m = re.search(r"\{\s*vsn\s*,\s*\"([^\"]*)\"", f.read())
+					f.close()
+					if m != None: version = m.group(1)
+				elif filename.endswith('.beam'):
+					stat = os.stat(filepath)
+					signature.update("%s %d %d\n" % (filename, stat.st_mtime, stat.st_size))
+			deps[ebin_path] = (version, signature.hexdigest())
+		return deps
+
+	def ensure(self, log=None):
+		# build or update the plt, returns its path or None if it cannot be built
+		self.lock.acquire()
+		try:
+			plt_path = self.get_plt_path()
+			state_path = "%s.state" % plt_path
+			deps = self.get_deps()
+			previous_deps = None
+			if os.path.exists(plt_path) and os.path.exists(state_path):
+				f = open(state_path, 'rb')
+				previous_deps = pickle.load(f)
+				f.close()
+			if previous_deps == deps: return plt_path
+			temp_path = "%s.tmp" % plt_path
+			if previous_deps == None or True in [not deps.has_key(ebin_path) or deps[ebin_path][0] != previous_deps[ebin_path][0] for ebin_path in previous_deps.keys()]:
+				# new plt, or deps removed or upgraded
+				if log != None: log("Building the project PLT, this may take a while.\n\n")
+				apps = SUBLIMERL.settings.get('dialyzer_plt_apps', ['erts', 'kernel', 'stdlib'])
+				args = ['--build_plt', '--output_plt', temp_path]
+				if len(deps) > 0: args += ['-r'] + sorted(deps.keys())
+				args += ['--apps'] + apps
+			else:
+				added = sorted([ebin_path for ebin_path in deps.keys() if not previous_deps.has_key(ebin_path)])
+				if len(added) > 0:
+					# new deps
+					if log != None: log("Adding %d dep(s) to the project PLT.\n\n" % len(added))
+					args = ['--add_to_plt', '--plt', plt_path, '--output_plt', temp_path, '-r'] + added
+				else:
+					# recompiled deps
+					if log != None: log("Updating the project PLT.\n\n")
+					args = ['--check_plt', '--plt', plt_path]
+					temp_path = None
+			if self.run_dialyzer(args) == False:
+				if temp_path != None and os.path.exists(temp_path): os.remove(temp_path)
+				if log != None: log("The project PLT could not be built.\n\n")
+				return None
+			if temp_path != None: os.rename(temp_path, plt_path)
+			f = open(state_path, 'wb')
+			pickle.dump(deps, f)
+			f.close()
+			return plt_path
+		finally:
+			self.lock.release()
+
+	def run_dialyzer(self, args):
+		if not os.path.exists(os.path.dirname(self.get_plt_path())): os.makedirs(os.path.dirname(self.get_plt_path()))
+		# low priority, in its own process group
+		p = subprocess.Popen([SUBLIMERL.dialyzer_path] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=SUBLIMERL.env, preexec_fn=lambda: (os.setsid(), os.nice(10)))
+		p.communicate()
+		# 2 means that warnings were emitted
+		return p.returncode in (0, 2)
+
+	def ensure_threaded(self):
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.ensure()
+		SublimErlThread().start()
+
+
+def get_plt(project_root):
+	global SUBLIMERL_PLTS
+	if not SUBLIMERL_PLTS.has_key(project_root):
+		SUBLIMERL_PLTS[project_root] = SublimErlPlt(project_root)
+	return SUBLIMERL_PLTS[project_root]
+
+
+# dialyzer warnings, by beam and plt
+class SublimErlDialyzerCache():
+
+	def get_key(self, beam_path, plt_path):
+		h = hashlib.sha1()
+		f = open(beam_path, 'rb')
+		h.update(f.read())
+		f.close()
+		# plts are too big to be hashed at every lookup
+		stat = os.stat(plt_path)
+		h.update("%s %d %d" % (plt_path, stat.st_mtime, stat.st_size))
+		return h.hexdigest()
+
+	def get_entry_path(self, key):
+		return os.path.join(SUBLIMERL.cache_path, 'dialyzer', key[:2], "%s.pickle" % key)
+
+	def get(self, beam_path, plt_path):
+		# { 'success', 'warnings' } where warnings are as reported by the dialyzer output parser, or None if the beam has not been analyzed
+		entry_path = self.get_entry_path(self.get_key(beam_path, plt_path))
+		if not os.path.exists(entry_path): return None
+		f = open(entry_path, 'rb')
+		entry = pickle.load(f)
+		f.close()
+		# entries of the previous format hold the warnings only
+		if not isinstance(entry, dict): return None
+		return entry
+
+	def set(self, beam_path, plt_path, success, warnings):
+		entry_path = self.get_entry_path(self.get_key(beam_path, plt_path))
+		if not os.path.exists(os.path.dirname(entry_path)): os.makedirs(os.path.dirname(entry_path))
+		# write atomically
+		temp_path = "%s.%d.tmp" % (entry_path, threading.current_thread().ident)
+		f = open(temp_path, 'wb')
+		pickle.dump({'success': success, 'warnings': warnings}, f)
+		f.close()
+		os.rename(temp_path, entry_path)
+
+	def analyze(self, beam_path, plt_path):
+		# analyze a beam at low priority and cache its warnings, returns the number of warnings or None on errors.
+		# the beam is analyzed alone, as the dialyzer command does: results depend on the modules analyzed together
+		parser = SublimErlDialyzerOutputParser(lambda: None)
+		p = subprocess.Popen([SUBLIMERL.dialyzer_path, '--plt', plt_path, '-n', beam_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=SUBLIMERL.env, preexec_fn=lambda: (os.setsid(), os.nice(10)))
+		for line in iter(p.stdout.readline, ''): parser.feed(line)
+		p.wait()
+		if parser.completed == False: return None
+		self.set(beam_path, plt_path, parser.success, parser.failures)
+		return len(parser.failures)
+
+SUBLIMERL_DIALYZER_CACHE = SublimErlDialyzerCache()
+
+
+# background dialyzer: the modules whose beam changed after a compile are compiled and analyzed in low priority batches
+class SublimErlDialyzerDaemon():
+
+	def __init__(self):
+		# init
+		self.pending = []
+		self.running = False
+		self.lock = threading.Lock()
+
+	def schedule(self, loader, module_paths):
+		if SUBLIMERL.settings.get('dialyzer_background', False) == False: return
+		self.lock.acquire()
+		try:
+			# every save comes with a new loader, modules are queued once per project
+			queued = set([(pending_loader.project_root, module_path) for pending_loader, module_path in self.pending])
+			for module_path in module_paths:
+				if (loader.project_root, module_path) in queued: continue
+				queued.add((loader.project_root, module_path))
+				self.pending.append((loader, module_path))
+			if self.running == True: return
+			self.running = True
+		finally:
+			self.lock.release()
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.run()
+		SublimErlThread().start()
+
+	def run(self):
+		while True:
+			# next batch, of modules of the same project
+			self.lock.acquire()
+			try:
+				if len(self.pending) == 0:
+					self.running = False
+					return
+				loader = self.pending[0][0]
+				batch = []
+				for pending_loader, module_path in self.pending:
+					if pending_loader.project_root == loader.project_root and module_path not in batch: batch.append(module_path)
+				batch = batch[:SUBLIMERL.settings.get('dialyzer_batch_size', 10)]
+				self.pending = [(pending_loader, module_path) for pending_loader, module_path in self.pending if not (pending_loader.project_root == loader.project_root and module_path in batch)]
+			finally:
+				self.lock.release()
+			self.analyze_batch(loader, batch)
+
+	def analyze_batch(self, loader, module_paths):
+		plt_path = get_plt(loader.project_root).ensure()
+		if plt_path == None: return
+		# compile to .eunit, as the dialyzer command does
+		beam_paths = []
+		for module_path in module_paths:
+			app_root = get_include_graph(loader.project_root).get_app_root(module_path)
+			if app_root == None: continue
+			eunit_path = os.path.join(app_root, '.eunit')
+			if not os.path.exists(eunit_path): os.makedirs(eunit_path)
+			retcode, data = SUBLIMERL_BEAM_CACHE.compile_module(loader, module_path, eunit_path, ['-DTEST', '+debug_info'], app_root)
+			beam_path = os.path.join(eunit_path, "%s.beam" % os.path.splitext(os.path.basename(module_path))[0])
+			if retcode == 0 and os.path.exists(beam_path) and SUBLIMERL_DIALYZER_CACHE.get(beam_path, plt_path) == None: beam_paths.append(beam_path)
+		warned = []
+		warnings_count = 0
+		for beam_path in beam_paths:
+			count = SUBLIMERL_DIALYZER_CACHE.analyze(beam_path, plt_path)
+			if count > 0:
+				warnings_count += count
+				warned.append(os.path.splitext(os.path.basename(beam_path))[0])
+		if warnings_count > 0:
+			text = "SublimErl: Dialyzer found %d warning(s) in %s." % (warnings_count, ', '.join(warned))
+			sublime.set_timeout(lambda: sublime.status_message(text), 0)
+
+SUBLIMERL_DIALYZER_DAEMON = SublimErlDialyzerDaemon()
+
+
+# listener
+class SublimErlPltListener(sublime_plugin.EventListener):
+
+	# CALLBACK ON VIEW LOADED
+	def on_load(self, view):
+		# check init successful
+		if SUBLIMERL.initialized == False or SUBLIMERL.settings.get('dialyzer_plt_background', True) == False: return
+		# only trigger within erlang
+		caret = view.sel()[0].a
+		if not ('source.erlang' in view.scope_name(caret) and sublime.platform() != 'windows'): return
+		# keep the plt of the project up to date
+		project_root = SublimErlProjectLoader(view).project_root
+		if project_root != None: get_plt(project_root).ensure_threaded()
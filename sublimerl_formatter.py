@@ -28,43 +28,177 @@
 
 
 # imports
-import sublime, sublime_plugin, os, tempfile
-from sublimerl_core import SUBLIMERL, SublimErlTextCommand, SublimErlProjectLoader
+import sublime, sublime_plugin, os, re, subprocess, difflib, hashlib, threading
+from sublimerl_core import SUBLIMERL, SublimErlTextCommand, SublimErlProjectLoader, SublimErlPanel
+
+
+# formatter process, reused across formats: sources are streamed over its stdin / stdout
+class SublimErlFormatterProcess():
+
+	def __init__(self):
+		# init
+		self.process = None
+		self.lock = threading.Lock()
+
+	def start(self):
+		formatter_path = os.path.join(SUBLIMERL.support_path, 'sublimerl_formatter.erl')
+		self.process = subprocess.Popen([SUBLIMERL.escript_path, formatter_path, 'server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'), env=SUBLIMERL.env)
+
+	def stop(self):
+		if self.process != None and self.process.poll() == None: self.process.kill()
+		self.process = None
+
+	def format(self, content):
+		# returns the formatted content, or None if the source cannot be formatted
+		self.lock.acquire()
+		try:
+			# restart the process once if it died
+			for attempt in range(2):
+				try:
+					if self.process == None or self.process.poll() != None: self.start()
+					self.process.stdin.write("%d\n%s" % (len(content), content))
+					self.process.stdin.flush()
+					header = self.process.stdout.readline()
+					if header.startswith('ok '): return self.process.stdout.read(int(header[3:]))
+					elif header == 'error\n': return None
+				except (IOError, OSError, ValueError):
+					pass
+				self.stop()
+		finally:
+			self.lock.release()
+
+# initialize
+SUBLIMERL_FORMATTER = SublimErlFormatterProcess()
 
 
 # main autoformat
 class SublimErlAutoFormat():
 
-	def __init__(self, view, edit):
+	def __init__(self, view):
 		self.view = view
-		self.edit = edit
 
 	def format(self):
-		# save current caret position
-		current_region = self.view.sel()[0]
-		# save current file contents to temp file
-		region_full = sublime.Region(0, self.view.size())
-		content = self.view.substr(region_full).encode('utf-8')
-		temp = tempfile.NamedTemporaryFile(delete=False)
-		temp.write(content)
-		temp.close()
-		# call erlang formatter
-		os.chdir(SUBLIMERL.support_path)
-		escript_command = "sublimerl_formatter.erl %s" % SUBLIMERL.shellquote(temp.name)
-		retcode, data = SUBLIMERL.execute_os_command('%s %s' % (SUBLIMERL.escript_path, escript_command))
-		# delete temp file
-		os.remove(temp.name)
-		if retcode == 0:
-			# substitute text
-			self.view.replace(self.edit, region_full, data.decode('utf-8'))
-			# reset caret to original position
-			self.view.sel().clear()
-			self.view.sel().add(current_region)
-			self.view.show(current_region)
+		# format the top-level forms of the selection, or the whole file
+		region = self.get_format_region()
+		content = self.view.substr(region).encode('utf-8')
+		change_count = self.view.change_count()
+		# format off the UI thread
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				data = SUBLIMERL_FORMATTER.format(content)
+				if data != None: sublime.set_timeout(lambda: this.on_formatted(region, content, data, change_count), 0)
+		SublimErlThread().start()
+
+	def on_formatted(self, region, content, data, change_count):
+		# do not clobber edits made while formatting
+		if self.view.change_count() != change_count:
+			sublime.status_message("SublimErl: the file changed while formatting, format again to apply.")
+			return
+		# substitute changed text only, so that folds, bookmarks and the caret are kept
+		edit = self.view.begin_edit()
+		self.apply_diff(edit, content.decode('utf-8'), data.decode('utf-8'), region.begin())
+		self.view.end_edit(edit)
+
+	def get_format_region(self):
+		selections = [r for r in self.view.sel() if not r.empty()]
+		if len(selections) == 0: return sublime.Region(0, self.view.size())
+		begin = min([r.begin() for r in selections])
+		end = max([r.end() for r in selections])
+		# a selection of full lines ends at the beginning of the next line
+		if self.view.line(end).begin() == end: end -= 1
+		# find the ends of top-level forms, i.e. dots followed by whitespace
+		code = SUBLIMERL.strip_code_for_parsing(self.view.substr(sublime.Region(0, self.view.size())))
+		form_ends = [m.end() for m in re.finditer(r"\.(?=\s|$)", code)]
+		# extend to the line after the end of the previous form
+		previous_ends = [form_end for form_end in form_ends if form_end <= begin]
+		if len(previous_ends) > 0:
+			begin = min(self.view.full_line(previous_ends[-1]).end(), self.view.line(begin).begin())
+		else:
+			begin = 0
+		# extend to the end of the line that ends the last form
+		next_ends = [form_end for form_end in form_ends if form_end > self.view.line(end).begin()]
+		if len(next_ends) > 0:
+			end = self.view.full_line(next_ends[0] - 1).end()
+		else:
+			end = self.view.size()
+		return sublime.Region(begin, end)
+
+	def apply_diff(self, edit, old, new, base=0):
+		old_lines = old.splitlines(True)
+		new_lines = new.splitlines(True)
+		# skip unchanged lines at both ends before diffing
+		start = 0
+		while start < len(old_lines) and start < len(new_lines) and old_lines[start] == new_lines[start]: start += 1
+		end = 0
+		while end < len(old_lines) - start and end < len(new_lines) - start and old_lines[-1 - end] == new_lines[-1 - end]: end += 1
+		# char offsets of old lines
+		offsets = [base]
+		for line in old_lines: offsets.append(offsets[-1] + len(line))
+		# line-level hunks
+		matcher = difflib.SequenceMatcher(None, old_lines[start:len(old_lines) - end], new_lines[start:len(new_lines) - end])
+		opcodes = matcher.get_opcodes()
+		# apply from the bottom, so that the offsets of the hunks above stay valid
+		opcodes.reverse()
+		for tag, i1, i2, j1, j2 in opcodes:
+			if tag == 'equal': continue
+			old_text = ''.join(old_lines[start + i1:start + i2])
+			new_text = ''.join(new_lines[start + j1:start + j2])
+			# char-level refinement: only replace what is between the common prefix and suffix
+			prefix = 0
+			max_prefix = min(len(old_text), len(new_text))
+			while prefix < max_prefix and old_text[prefix] == new_text[prefix]: prefix += 1
+			suffix = 0
+			max_suffix = max_prefix - prefix
+			while suffix < max_suffix and old_text[-1 - suffix] == new_text[-1 - suffix]: suffix += 1
+			region = sublime.Region(offsets[start + i1] + prefix, offsets[start + i2] - suffix)
+			self.view.replace(edit, region, new_text[prefix:len(new_text) - suffix])
+
+
+# project formatter
+class SublimErlProjectFormatter(SublimErlProjectLoader):
+
+	def __init__(self, view):
+		# init super
+		SublimErlProjectLoader.__init__(self, view)
+		# init
+		self.panel_name = 'sublimerl_formatter'
+		# setup panel
+		self.setup_panel()
+
+	def setup_panel(self):
+		self.panel = SublimErlPanel(self.window, self.panel_name, 'SublimErlAutocompile')
+
+	def log(self, text):
+		self.panel.write(text)
+
+	def format_project(self, check_only=False):
+		if self.project_root == None: return
+		# cache of the hashes of files known to be formatted
+		cache_file_path = os.path.join(SUBLIMERL.cache_path, 'formatted', "%s.pickle" % hashlib.sha1(self.project_root).hexdigest())
+		os_cmd = "python %s %s %s %s %d" % (self.shellquote(os.path.join(SUBLIMERL.support_path, 'sublimerl_project_formatter.py')), self.shellquote(SUBLIMERL.escript_path), self.shellquote(self.project_root), self.shellquote(cache_file_path), SUBLIMERL.settings.get('format_workers', 4))
+		if check_only == True: os_cmd += ' check'
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.execute_os_command(os_cmd, log=False)
+		SublimErlThread().start()
 
 
 # format command
 class SublimErlAutoFormatCommand(SublimErlTextCommand):
 	def run_command(self, edit):
-		formatter = SublimErlAutoFormat(self.view, edit)
+		formatter = SublimErlAutoFormat(self.view)
 		formatter.format()
+
+
+# format project command
+class SublimErlFormatProjectCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlProjectFormatter(self.view).format_project()
+
+
+# check project format command
+class SublimErlCheckProjectFormatCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlProjectFormatter(self.view).format_project(check_only=True)
@@ -28,76 +28,188 @@
 
 
 # imports
-import sublime
-import os, time, threading, pickle
-from sublimerl_core import SUBLIMERL, SublimErlTextCommand, SublimErlProjectLoader
-from sublimerl_completion import SUBLIMERL_COMPLETIONS
+import sublime, sublime_plugin
+import os, re, heapq
+from sublimerl_core import SUBLIMERL, SublimErlTextCommand
+from sublimerl_completion import SublimErlIndexes
+
+# lines to go to once their views are loaded, by view id
+SUBLIMERL_PENDING_GOTOS = {}
 
 
 # main autoformat
 class SublimErlFunctionSearch():
 
-	def __init__(self, view):
+	def __init__(self, view, code_type='current_project'):
 		# init
 		self.view = view
 		self.window = view.window()
+		self.code_type = code_type
 		self.search_completions = []
 
 	def show(self):
+		# query, defaulting to the word under the cursor
+		word = self.view.substr(self.view.word(self.view.sel()[0]))
+		if re.match(r"^[a-z][a-zA-Z0-9_:]*$", word) == None: word = ''
+		self.window.show_input_panel("Function:", word, self.on_query, None, None)
+
+	def on_query(self, query):
 		# get completions
-		self.set_search_completions()
+		self.set_search_completions(query.strip())
 		# strip out just the function name to be displayed
 		completions = []
 		for name, filepath, lineno in self.search_completions:
 			completions.append(name)
 		# open quick panel
-		sublime.active_window().show_quick_panel(completions, self.on_select)
+		if len(completions) > 0: self.window.show_quick_panel(completions, self.on_select)
+		else: sublime.status_message("SublimErl: no function matches \"%s\"." % query)
 
-	def set_search_completions(self):
-		# load file
-		searches_filepath = os.path.join(SUBLIMERL.plugin_path, "completion", "Current-Project.searches")
-		f = open(searches_filepath, 'r')
-		searches = pickle.load(f)
-		f.close()
-		self.search_completions = searches
+	def set_search_completions(self, query):
+		searches = SublimErlIndexes().get(self.code_type, 'searches')
+		max_results = SUBLIMERL.settings.get('function_search_max_results', 100)
+		if len(query) == 0:
+			self.search_completions = searches[:max_results]
+			return
+		# pre-filter on the subsequence, then rank
+		query = query.lower()
+		regex = re.compile('.*?'.join([re.escape(c) for c in query]))
+		scored = []
+		for search in searches:
+			name = search[0].lower()
+			if regex.search(name) == None: continue
+			scored.append((self.score(query, name), search))
+		self.search_completions = [search for score, search in heapq.nlargest(max_results, scored, key=lambda k: k[0])]
+
+	def score(self, query, name):
+		# subsequence score: consecutive characters and word starts rank higher, then shorter names
+		score = 0
+		if name.startswith(query): score += 1000
+		qi = 0
+		previous = -2
+		for ni in range(len(name)):
+			if qi == len(query): break
+			if name[ni] == query[qi]:
+				score += 1
+				if ni == previous + 1: score += 5
+				if ni == 0 or name[ni - 1] in ':_/': score += 10
+				previous = ni
+				qi += 1
+		return score * 100 - len(name)
 
 	def on_select(self, index):
+		if index == -1: return
 		# get file and line
 		name, filepath, lineno = self.search_completions[index]
 		# open module at function position
-		self.open_file_and_goto_line(filepath, lineno)
-
-	def open_file_and_goto_line(self, filepath, line):
-		# open file
-		self.new_view = self.window.open_file(filepath)
-		# wait until file is loaded before going to the appropriate line
-		this = self
-		self.check_file_loading()
-		class SublimErlThread(threading.Thread):
-			def run(self):
-				# wait until file has done loading
-				s = 0
-				while this.is_loading and s < 3:
-					time.sleep(0.1)
-					sublime.set_timeout(this.check_file_loading, 0)
-					s += 1
-				# goto line
-				def goto_line():
-					# goto line
-					this.new_view.run_command("goto_line", {"line": line} )
-					# remove unused attrs
-					del this.new_view
-					del this.is_loading
-				if not this.is_loading: sublime.set_timeout(goto_line, 0)
-
-		SublimErlThread().start()
-
-	def check_file_loading(self):
-		self.is_loading = self.new_view.is_loading()
-
-
-# repeat last test
+		SublimErlFileOpener().open(self.window, filepath, lineno)
+
+
+# go to definition of the function under the cursor
+class SublimErlGotoDefinition():
+
+	def __init__(self, view):
+		# init
+		self.view = view
+		self.window = view.window()
+
+	def goto(self):
+		function_at = SUBLIMERL.get_function_at(self.view, self.view.sel()[0].begin())
+		if function_at == None: return
+		module, function, arity = function_at
+		if module == None:
+			# local function, or auto-imported BIF
+			location = self.find_definition(SUBLIMERL.get_erlang_module_name(self.view), function, arity)
+			if location == None: location = self.find_definition('erlang', function, arity)
+		else:
+			location = self.find_definition(module, function, arity)
+		if location == None:
+			sublime.status_message("SublimErl: cannot find the definition of %s." % function)
+			return
+		filepath, lineno = location
+		SublimErlFileOpener().open(self.window, filepath, lineno)
+
+	def find_definition(self, module, function, arity):
+		# project first, then erlang libs
+		for code_type in ('current_project', 'erlang_libs'):
+			definitions = SublimErlIndexes().get(code_type, 'definitions')
+			if not definitions.has_key(module): continue
+			filepath, functions = definitions[module]
+			if functions.has_key((function, arity)): return (filepath, functions[(function, arity)])
+			# arity unknown or not matching: first definition with any arity
+			lines = [lineno for (name, name_arity), lineno in functions.items() if name == function]
+			if len(lines) > 0: return (filepath, min(lines))
+
+
+# find the calls to the function under the cursor
+class SublimErlFindUsages():
+
+	def __init__(self, view):
+		# init
+		self.view = view
+		self.window = view.window()
+		self.usages = []
+
+	def show(self):
+		function_at = SUBLIMERL.get_function_at(self.view, self.view.sel()[0].begin())
+		if function_at == None: return
+		module, function, arity = function_at
+		if module == None: module = SUBLIMERL.get_erlang_module_name(self.view)
+		self.usages = sorted(SublimErlIndexes().get_usages((module, function, arity)))
+		if len(self.usages) == 0:
+			sublime.status_message("SublimErl: no usages of %s:%s/%s found." % (module, function, arity))
+			return
+		# show
+		self.window.show_quick_panel([["%s:%d" % (os.path.splitext(os.path.basename(filepath))[0], lineno), filepath] for filepath, lineno in self.usages], self.on_select)
+
+	def on_select(self, index):
+		if index == -1: return
+		filepath, lineno = self.usages[index]
+		SublimErlFileOpener().open(self.window, filepath, lineno)
+
+
+# file opener: goes to line once the file is loaded
+class SublimErlFileOpener():
+
+	def open(self, window, filepath, line):
+		global SUBLIMERL_PENDING_GOTOS
+		view = window.open_file(filepath)
+		if view.is_loading():
+			SUBLIMERL_PENDING_GOTOS[view.id()] = line
+		else:
+			view.run_command("goto_line", {"line": line})
+
+
+# listener
+class SublimErlFileOpenerListener(sublime_plugin.EventListener):
+
+	# CALLBACK ON VIEW LOADED
+	def on_load(self, view):
+		global SUBLIMERL_PENDING_GOTOS
+		if SUBLIMERL_PENDING_GOTOS.has_key(view.id()):
+			view.run_command("goto_line", {"line": SUBLIMERL_PENDING_GOTOS.pop(view.id())})
+
+
+# function search
 class SublimErlFunctionSearchCommand(SublimErlTextCommand):
 	def run_command(self, edit):
 		search = SublimErlFunctionSearch(self.view)
 		search.show()
+
+
+# erlang libs function search
+class SublimErlLibFunctionSearchCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		search = SublimErlFunctionSearch(self.view, 'erlang_libs')
+		search.show()
+
+
+# go to definition
+class SublimErlGotoDefinitionCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlGotoDefinition(self.view).goto()
+
+
+# find usages
+class SublimErlFindUsagesCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlFindUsages(self.view).show()
@@ -0,0 +1,222 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+# imports
+import os, re, glob, threading
+from sublimerl_core import SUBLIMERL
+
+# include graphs, per project root
+SUBLIMERL_INCLUDE_GRAPHS = {}
+
+
+# include graph: erlang files -> included .hrl files
+class SublimErlIncludeGraph():
+
+	def __init__(self, project_root):
+		# init
+		self.project_root = project_root
+		self.includes = {}
+		# files with includes that could not be resolved
+		self.unresolved = set()
+		self.app_roots = {}
+		# {i, Dir} include directories of the erl_opts, by app root
+		self.include_dirs = {}
+		self.built = False
+		self.lock = threading.Lock()
+
+		self.regex = {
+			'include': re.compile(r"^\s*-\s*include(_lib)?\s*\(\s*\"([^\"]+)\"\s*\)\s*\.", re.MULTILINE),
+			'include_dir': re.compile(r"\{\s*i\s*,\s*\"([^\"]+)\"\s*\}")
+		}
+
+	def build(self):
+		# parse all the erlang files of the project, once
+		self.lock.acquire()
+		try:
+			if self.built == True: return
+			self.set_app_roots()
+			for root, dirnames, filenames in os.walk(self.project_root):
+				# exclude eunit files
+				if '.eunit' in dirnames: dirnames.remove('.eunit')
+				for filename in filenames:
+					if os.path.splitext(filename)[1] in ('.erl', '.hrl'):
+						self._update_file(os.path.join(root, filename))
+			self.built = True
+		finally:
+			self.lock.release()
+
+	def set_app_roots(self):
+		# map app names to their directories, for -include_lib resolution
+		self.app_roots = {}
+		candidates = [self.project_root]
+		for container in ('apps', 'deps'):
+			container_path = os.path.join(self.project_root, container)
+			if os.path.isdir(container_path):
+				candidates.extend([os.path.join(container_path, name) for name in os.listdir(container_path)])
+		for app_root in candidates:
+			if not os.path.isdir(app_root): continue
+			# name of the directory, without the eventual version
+			self.app_roots[os.path.basename(app_root).split('-')[0]] = app_root
+			# name in .app.src
+			src_path = os.path.join(app_root, 'src')
+			if os.path.isdir(src_path):
+				for f in os.listdir(src_path):
+					if f.endswith('.app.src'): self.app_roots[f[:-len('.app.src')]] = app_root
+
+	def update_file(self, filepath):
+		if os.path.basename(filepath) == 'rebar.config':
+			# include directories may have changed, resolve everything again
+			self.lock.acquire()
+			try:
+				self.includes = {}
+				self.unresolved = set()
+				self.include_dirs = {}
+				self.built = False
+			finally:
+				self.lock.release()
+		self.build()
+		self.lock.acquire()
+		try:
+			self._update_file(os.path.abspath(filepath))
+		finally:
+			self.lock.release()
+
+	def _update_file(self, filepath):
+		self.unresolved.discard(filepath)
+		if not os.path.exists(filepath):
+			if self.includes.has_key(filepath): del self.includes[filepath]
+			return
+		f = open(filepath, 'r')
+		code = SUBLIMERL.strip_comments(f.read())
+		f.close()
+		includes = []
+		for m in self.regex['include'].finditer(code):
+			include_path = self.resolve_include(filepath, m.group(2), m.group(1) != None)
+			if include_path != None: includes.append(include_path)
+			else: self.unresolved.add(filepath)
+		self.includes[filepath] = includes
+		# headers outside of the project, found through the include directories
+		for include_path in includes:
+			if not self.includes.has_key(include_path): self._update_file(include_path)
+
+	def resolve_include(self, filepath, include, is_include_lib):
+		# files relative to the including file or to the app's include directory
+		app_root = self.get_app_root(filepath)
+		candidates = [os.path.dirname(filepath)]
+		if app_root != None: candidates.extend([os.path.join(app_root, 'include'), app_root] + self.get_include_dirs(app_root))
+		for candidate in candidates:
+			include_path = os.path.abspath(os.path.join(candidate, include))
+			if os.path.exists(include_path): return include_path
+		# -include_lib("app/include/file.hrl")
+		if is_include_lib:
+			parts = include.split('/', 1)
+			if len(parts) == 2 and self.app_roots.has_key(parts[0]):
+				include_path = os.path.join(self.app_roots[parts[0]], parts[1])
+				if os.path.exists(include_path): return include_path
+			# OTP apps
+			if len(parts) == 2 and SUBLIMERL.erlang_libs_path != None:
+				for lib_path in sorted(glob.glob(os.path.join(SUBLIMERL.erlang_libs_path, "%s-*" % parts[0])), reverse=True):
+					include_path = os.path.join(lib_path, parts[1])
+					if os.path.exists(include_path): return include_path
+
+	def get_include_dirs(self, app_root):
+		# {i, Dir} of the erl_opts of the app's rebar.config, or of the project's one if the app has none, as the compiler does
+		if not self.include_dirs.has_key(app_root):
+			include_dirs = []
+			for config_path in (os.path.join(app_root, 'rebar.config'), os.path.join(self.project_root, 'rebar.config')):
+				if not os.path.exists(config_path): continue
+				f = open(config_path, 'r')
+				config = SUBLIMERL.strip_comments(f.read())
+				f.close()
+				include_dirs = [os.path.abspath(os.path.join(app_root, m.group(1))) for m in self.regex['include_dir'].finditer(config)]
+				break
+			self.include_dirs[app_root] = include_dirs
+		return self.include_dirs[app_root]
+
+	def get_app_root(self, filepath):
+		# the app root is the parent of the src, include or test directory
+		current_dir = os.path.dirname(os.path.abspath(filepath))
+		while len(current_dir) > len(self.project_root):
+			if os.path.basename(current_dir) in ('src', 'include', 'test'): return os.path.dirname(current_dir)
+			current_dir = os.path.dirname(current_dir)
+
+	def get_transitive_includes(self, filepath):
+		# all files included by filepath, directly or through other includes
+		self.build()
+		self.lock.acquire()
+		try:
+			found = []
+			pending = list(self.includes.get(os.path.abspath(filepath), []))
+			while len(pending) > 0:
+				include_path = pending.pop()
+				if include_path in found: continue
+				found.append(include_path)
+				pending.extend(self.includes.get(include_path, []))
+			return found
+		finally:
+			self.lock.release()
+
+	def has_unresolved_includes(self, filepath):
+		# True if filepath, or one of the files it includes, has an include that could not be found
+		filepath = os.path.abspath(filepath)
+		transitive_includes = self.get_transitive_includes(filepath)
+		self.lock.acquire()
+		try:
+			return True in [path in self.unresolved for path in [filepath] + transitive_includes]
+		finally:
+			self.lock.release()
+
+	def get_dependent_modules(self, include_path):
+		# all .erl files that include include_path, directly or through other includes
+		self.build()
+		self.lock.acquire()
+		try:
+			# reverse graph
+			includers = {}
+			for filepath, includes in self.includes.items():
+				for included in includes:
+					includers.setdefault(included, []).append(filepath)
+			# walk it
+			found = []
+			pending = [os.path.abspath(include_path)]
+			while len(pending) > 0:
+				current = pending.pop()
+				for filepath in includers.get(current, []):
+					if filepath in found: continue
+					found.append(filepath)
+					pending.append(filepath)
+			return sorted([filepath for filepath in found if filepath.endswith('.erl')])
+		finally:
+			self.lock.release()
+
+
+def get_include_graph(project_root):
+	global SUBLIMERL_INCLUDE_GRAPHS
+	if not SUBLIMERL_INCLUDE_GRAPHS.has_key(project_root):
+		SUBLIMERL_INCLUDE_GRAPHS[project_root] = SublimErlIncludeGraph(project_root)
+	return SUBLIMERL_INCLUDE_GRAPHS[project_root]
@@ -29,8 +29,211 @@
 
 # imports
 import sublime
-import os
-from sublimerl_core import SUBLIMERL, SublimErlTextCommand, SublimErlGlobal
+import os, re, json, gzip, pickle, heapq, threading
+from sublimerl_core import SUBLIMERL, SublimErlTextCommand, SublimErlGlobal, SublimErlPanel
+
+
+# rendered man pages, stored compressed per OTP version
+class SublimErlDocStore():
+
+	def __init__(self):
+		# init
+		self.module_names = None
+		self.recent = []
+		self.recent_pages = {}
+		self.lock = threading.Lock()
+		self.prerender_started = False
+		self.index = None
+		self.regex = {
+			'function_head': re.compile(r"^\s{1,8}([a-z][a-zA-Z0-9_]*)(\(.*)$"),
+			'section_end': re.compile(r"^\S"),
+			'word': re.compile(r"[a-z0-9_]{2,}")
+		}
+
+	def get_docs_path(self):
+		return os.path.join(SUBLIMERL.cache_path, 'docs', SUBLIMERL.get_otp_fingerprint())
+
+	def get_module_names(self):
+		if self.module_names != None: return self.module_names
+		modules_filepath = os.path.join(self.get_docs_path(), 'modules.pickle')
+		if os.path.exists(modules_filepath):
+			f = open(modules_filepath, 'rb')
+			self.module_names = pickle.load(f)
+			f.close()
+			return self.module_names
+		# build from the erlang libs completions
+		completions_filepath = os.path.join(SUBLIMERL.completions_path, "Erlang-Libs.sublime-completions.full")
+		if not os.path.exists(completions_filepath): return []
+		f = open(completions_filepath, 'r')
+		contents = json.load(f)
+		f.close()
+		self.module_names = sorted([str(t['trigger']) for t in contents['completions']])
+		if not os.path.exists(self.get_docs_path()): os.makedirs(self.get_docs_path())
+		f = open(modules_filepath, 'wb')
+		pickle.dump(self.module_names, f)
+		f.close()
+		return self.module_names
+
+	def get_page(self, module_name):
+		# recently viewed pages are kept in memory
+		self.lock.acquire()
+		try:
+			if self.recent_pages.has_key(module_name):
+				self.recent.remove(module_name)
+				self.recent.append(module_name)
+				return self.recent_pages[module_name]
+		finally:
+			self.lock.release()
+		page = self.load_page(module_name)
+		if page == None and not os.path.exists(self.get_missing_path(module_name)): page = self.render_page(module_name)
+		if page == None: return
+		self.lock.acquire()
+		try:
+			if not self.recent_pages.has_key(module_name):
+				self.recent.append(module_name)
+				if len(self.recent) > SUBLIMERL.settings.get('man_recent_pages', 20): del self.recent_pages[self.recent.pop(0)]
+			self.recent_pages[module_name] = page
+		finally:
+			self.lock.release()
+		return page
+
+	def get_page_path(self, module_name):
+		return os.path.join(self.get_docs_path(), "%s.txt.gz" % module_name)
+
+	def get_missing_path(self, module_name):
+		# marker of the modules that have no man page, so that they are not rendered again
+		return os.path.join(self.get_docs_path(), "%s.none" % module_name)
+
+	def load_page(self, module_name):
+		page_path = self.get_page_path(module_name)
+		if not os.path.exists(page_path): return
+		f = gzip.open(page_path, 'rb')
+		page = f.read()
+		f.close()
+		return page
+
+	def render_page(self, module_name):
+		retcode, data = SUBLIMERL.execute_os_command("%s -man %s | col -b" % (SUBLIMERL.erl_path, module_name))
+		page_path = self.get_page_path(module_name)
+		if not os.path.exists(os.path.dirname(page_path)): os.makedirs(os.path.dirname(page_path))
+		if retcode != 0 or len(data.strip()) == 0:
+			open(self.get_missing_path(module_name), 'wb').close()
+			return
+		# write atomically, the page may be rendered by the prerender thread at the same time
+		temp_path = "%s.%d.tmp" % (page_path, threading.current_thread().ident)
+		f = gzip.open(temp_path, 'wb')
+		f.write(data)
+		f.close()
+		os.rename(temp_path, page_path)
+		return data
+
+	def get_sections(self, module_name):
+		page = self.get_page(module_name)
+		if page == None: return {}
+		return self.split_sections(page)
+
+	def split_sections(self, page):
+		# documentation of every exported function, by (function, arity)
+		sections = {}
+		heads = []
+		section_lines = None
+		in_exports = False
+		for line in page.split('\n') + ['']:
+			if in_exports == False:
+				in_exports = line.strip() == 'EXPORTS'
+				continue
+			m = self.regex['function_head'].match(line)
+			if m != None and m.group(2).find('->') != -1:
+				if section_lines != None and len(''.join(section_lines[len(heads):]).strip()) > 0:
+					# a new function starts
+					for head in heads: sections[head] = '\n'.join(section_lines).rstrip() + '\n'
+					heads = []
+					section_lines = None
+				if section_lines == None: section_lines = []
+				arity = SUBLIMERL.count_arguments(m.group(2))
+				if arity != None: heads.append((m.group(1), arity))
+				section_lines.append(line)
+			elif self.regex['section_end'].match(line) != None:
+				# end of the exports
+				in_exports = False
+				if section_lines != None:
+					for head in heads: sections[head] = '\n'.join(section_lines).rstrip() + '\n'
+				heads = []
+				section_lines = None
+			elif section_lines != None:
+				section_lines.append(line)
+		return sections
+
+	def get_index(self):
+		# inverted index of the words of every function documentation
+		if self.index == None:
+			index_filepath = os.path.join(self.get_docs_path(), 'index.pickle')
+			if os.path.exists(index_filepath):
+				f = open(index_filepath, 'rb')
+				self.index = pickle.load(f)
+				f.close()
+			else:
+				self.index = {'modules': set(), 'words': {}}
+		return self.index
+
+	def build_index(self):
+		# add the stored pages that have not been indexed yet
+		index = self.get_index()
+		changed = False
+		for module_name in self.get_module_names():
+			if module_name in index['modules'] or not os.path.exists(self.get_page_path(module_name)): continue
+			for (function, arity), text in self.split_sections(self.load_page(module_name)).items():
+				key = (module_name, function, arity)
+				for word in self.regex['word'].findall(text.lower()):
+					counts = index['words'].setdefault(word, {})
+					counts[key] = counts.get(key, 0) + 1
+			index['modules'].add(module_name)
+			changed = True
+		if changed == False: return
+		# write atomically
+		index_filepath = os.path.join(self.get_docs_path(), 'index.pickle')
+		temp_path = "%s.%d.tmp" % (index_filepath, threading.current_thread().ident)
+		f = open(temp_path, 'wb')
+		pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+		f.close()
+		os.rename(temp_path, index_filepath)
+
+	def search(self, query):
+		# (module, function, arity) of the documentations containing all the words of query, best matches first
+		words = self.regex['word'].findall(query.lower())
+		if len(words) == 0: return []
+		index = self.get_index()
+		scores = None
+		for word in words:
+			counts = index['words'].get(word, {})
+			if scores == None: scores = dict(counts)
+			else: scores = dict([(key, score + counts[key]) for key, score in scores.items() if counts.has_key(key)])
+			if len(scores) == 0: return []
+		for key in scores.keys():
+			# favour words in the function name
+			scores[key] += 10 * len([word for word in words if word in key[1]])
+		return [key for key, score in heapq.nlargest(SUBLIMERL.settings.get('man_search_max_results', 100), scores.items(), key=lambda k: k[1])]
+
+	def is_skipped(self, module_name):
+		# modules excluded from the completions are not prerendered, they can still be shown
+		for regex in SUBLIMERL.completion_skip_erlang_libs:
+			if re.search(regex, module_name): return True
+		return False
+
+	def prerender(self):
+		# render all the pages not stored yet and index them, once per session
+		if self.prerender_started == True: return
+		self.prerender_started = True
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				for module_name in this.get_module_names():
+					if this.is_skipped(module_name): continue
+					if not os.path.exists(this.get_page_path(module_name)) and not os.path.exists(this.get_missing_path(module_name)): this.render_page(module_name)
+				this.build_index()
+		SublimErlThread().start()
+
+SUBLIMERL_DOC_STORE = SublimErlDocStore()
 
 
 # show man
@@ -43,55 +246,75 @@ class SublimErlMan():
 		self.module_names = []
 
 		self.panel_name = 'sublimerl_man'
-		self.panel_buffer = ''
 		# setup panel
 		self.setup_panel()
 
 	def setup_panel(self):
-		self.panel = self.window.get_output_panel(self.panel_name)
-		self.panel.settings().set("syntax", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlAutocompile.hidden-tmLanguage"))
-		self.panel.settings().set("color_scheme", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlAutocompile.hidden-tmTheme"))
-
-	def update_panel(self):
-		if len(self.panel_buffer):
-			panel_edit = self.panel.begin_edit()
-			self.panel.insert(panel_edit, self.panel.size(), self.panel_buffer)
-			self.panel.end_edit(panel_edit)
-			self.panel.show(self.panel.size())
-			self.panel_buffer = ''
-			self.window.run_command("show_panel", {"panel": "output.%s" % self.panel_name})
+		self.panel = SublimErlPanel(self.window, self.panel_name, 'SublimErlAutocompile')
 
 	def hide_panel(self):
-		self.window.run_command("hide_panel")
+		self.panel.hide()
 
 	def log(self, text):
-		self.panel_buffer += text
-		sublime.set_timeout(self.update_panel, 0)
+		self.panel.write(text)
 
 	def show(self):
 		# set modules
-		self.set_module_names()
+		self.module_names = SUBLIMERL_DOC_STORE.get_module_names()
 		# open quick panel
 		sublime.active_window().show_quick_panel(self.module_names, self.on_select)
-
-	def set_module_names(self):
-		# load file
-		modules_filepath = os.path.join(SUBLIMERL.plugin_path, "completion", "Erlang-libs.sublime-completions")
-		f = open(modules_filepath, 'r')
-		contents = eval(f.read())
-		f.close()
-		# strip out just the module names to be displayed
-		module_names = []
-		for t in contents['completions']:
-			module_names.append(t['trigger'])
-		self.module_names = module_names
+		# render the other pages in the background
+		SUBLIMERL_DOC_STORE.prerender()
 
 	def on_select(self, index):
-		# get file and line
+		if index == -1: return
+		# get module
 		module_name = self.module_names[index]
-		# open man
-		retcode, data = SUBLIMERL.execute_os_command("%s -man %s | col -b" % (SUBLIMERL.erl_path, module_name))
-		if retcode == 0: self.log(data)
+		# open man, rendering it outside of the ui thread if it is not stored yet
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				page = SUBLIMERL_DOC_STORE.get_page(module_name)
+				if page != None: this.log(page)
+				else: sublime.set_timeout(lambda: sublime.status_message("SublimErl: no man page found for %s." % module_name), 0)
+		SublimErlThread().start()
+
+
+	def show_function(self):
+		# documentation of the function under the cursor
+		function_at = SUBLIMERL.get_function_at(self.view, self.view.sel()[0].begin())
+		if function_at == None: return
+		module_name, function, arity = function_at
+		# local calls can only be documented BIFs
+		if module_name == None: module_name = 'erlang'
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				sections = SUBLIMERL_DOC_STORE.get_sections(module_name)
+				text = sections.get((function, arity))
+				if text == None:
+					# any arity
+					keys = sorted([key for key in sections.keys() if key[0] == function])
+					if len(keys) > 0: text = ''.join([sections[key] for key in keys])
+				if text != None: this.log(text)
+				else: sublime.set_timeout(lambda: sublime.status_message("SublimErl: no documentation found for %s:%s." % (module_name, function)), 0)
+		SublimErlThread().start()
+		SUBLIMERL_DOC_STORE.prerender()
+
+	def show_search(self):
+		self.window.show_input_panel("Search docs:", '', self.on_query, None, None)
+		SUBLIMERL_DOC_STORE.prerender()
+
+	def on_query(self, query):
+		self.results = SUBLIMERL_DOC_STORE.search(query)
+		if len(self.results) > 0: self.window.show_quick_panel(["%s:%s/%d" % key for key in self.results], self.on_search_select)
+		else: sublime.status_message("SublimErl: no documentation matches \"%s\"." % query)
+
+	def on_search_select(self, index):
+		if index == -1: return
+		module_name, function, arity = self.results[index]
+		text = SUBLIMERL_DOC_STORE.get_sections(module_name).get((function, arity))
+		if text != None: self.log(text)
 
 
 # man command
@@ -99,3 +322,17 @@ class SublimErlManCommand(SublimErlTextCommand):
 	def run_command(self, edit):
 		man = SublimErlMan(self.view)
 		man.show()
+
+
+# man of function under the cursor
+class SublimErlManFunctionCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		man = SublimErlMan(self.view)
+		man.show_function()
+
+
+# man search
+class SublimErlManSearchCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		man = SublimErlMan(self.view)
+		man.show_search()
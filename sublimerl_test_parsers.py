@@ -0,0 +1,246 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+
+# imports
+import sublime
+import re, time, threading
+from sublimerl_core import SUBLIMERL
+
+
+# live test counters in the status bar, refreshed at a capped rate
+class SublimErlTestProgress():
+
+	def __init__(self):
+		# init
+		self.last_update = 0
+		self.lock = threading.Lock()
+
+	def show(self, passed, failed, skipped, force=False):
+		self.lock.acquire()
+		try:
+			if force == False and time.time() - self.last_update < 0.2: return
+			self.last_update = time.time()
+		finally:
+			self.lock.release()
+		text = "SublimErl: %d passed, %d failed, %d skipped" % (passed, failed, skipped)
+		sublime.set_timeout(lambda: sublime.status_message(text), 0)
+
+SUBLIMERL_TEST_PROGRESS = SublimErlTestProgress()
+
+
+# line oriented parser of test output: counts and failures are updated as lines stream in, only the tail of the raw output is kept
+class SublimErlOutputParser():
+
+	def __init__(self, on_update=None):
+		# init
+		self.passed = 0
+		self.failed = 0
+		self.skipped = 0
+		# list of { 'module', 'test', 'reason', 'line' }
+		self.failures = []
+		self.completed = False
+		self.on_update = on_update
+		self.output = []
+		self.output_size = 0
+		self.max_output_size = SUBLIMERL.settings.get('panel_max_size', 500000)
+
+	def feed(self, line):
+		# keep the tail of the raw output
+		self.output.append(line)
+		self.output_size += len(line)
+		while self.output_size > self.max_output_size and len(self.output) > 1:
+			self.output_size -= len(self.output.pop(0))
+		counts = (self.passed, self.failed, self.skipped)
+		self.parse_line(line.rstrip('\n'))
+		if counts != (self.passed, self.failed, self.skipped): self.update()
+
+	def parse_line(self, line):
+		# placeholder for inheritance
+		pass
+
+	def update(self):
+		if self.on_update != None: self.on_update()
+		else: SUBLIMERL_TEST_PROGRESS.show(self.passed, self.failed, self.skipped)
+
+	def get_output(self):
+		return ''.join(self.output)
+
+	def add_failure(self, module, test, reason='', line=None):
+		failure = { 'module': module, 'test': test, 'reason': reason, 'line': line }
+		self.failures.append(failure)
+		return failure
+
+	def format_failures(self):
+		lines = []
+		for failure in self.failures:
+			location = ''
+			if failure['line'] != None: location = ", line %d" % failure['line']
+			name = ':'.join([name for name in (failure['module'], failure['test']) if name != None])
+			lines.append("  %s%s: %s\n" % (name, location, failure['reason'].split('\n')[0]))
+		return ''.join(lines)
+
+
+# eunit output parser, of both the default and the verbose eunit outputs
+class SublimErlEunitOutputParser(SublimErlOutputParser):
+
+	regex = {
+		'result': re.compile(r"^\s*(?:([a-z][a-zA-Z0-9_]*)\s*:\s*)?(?:\d+:\s*)?(.*?)\.\.\.(?:\[([\d.]+) s\] )?(ok|\*failed\*|\*skipped\*|\*timed out\*)\s*$"),
+		'location': re.compile(r"^in function (\S+) \((.+), line (\d+)\)"),
+		'reason': re.compile(r"^(?:\*\*|::)(\w+:.*)$"),
+		'all_passed': re.compile(r"All (\d+) tests passed\."),
+		'one_passed': re.compile(r"^\s*Test passed\."),
+		'summary': re.compile(r"Failed: (\d+)\.\s+Skipped: (\d+)\.\s+Passed: (\d+)\."),
+		'no_tests': re.compile(r"There were no tests to run\.")
+	}
+
+	def __init__(self, on_update=None):
+		SublimErlOutputParser.__init__(self, on_update)
+		# failure whose details are being read
+		self.failure = None
+		# (module, test, outcome, duration) of the tests reported one by one
+		self.results = []
+
+	def parse_line(self, line):
+		m = self.regex['result'].match(line)
+		if m != None:
+			self.failure = None
+			test = m.group(2).split(' ')[0] or None
+			if m.group(4) == 'ok':
+				self.passed += 1
+				outcome = 'passed'
+			elif m.group(4) == '*skipped*':
+				self.skipped += 1
+				outcome = 'skipped'
+			else:
+				self.failed += 1
+				self.failure = self.add_failure(m.group(1), test, m.group(4).strip('*'))
+				outcome = 'failed'
+			duration = None
+			if m.group(3) != None: duration = float(m.group(3))
+			self.results.append((m.group(1), test, outcome, duration))
+			return
+		if self.failure != None:
+			m = self.regex['location'].match(line)
+			if m != None:
+				self.failure['line'] = int(m.group(3))
+				return
+			m = self.regex['reason'].match(line)
+			if m != None:
+				self.failure['reason'] = m.group(1)
+				return
+			if len(line.strip()) == 0 or line.startswith('='):
+				self.failure = None
+			elif self.failure['reason'] not in ('failed', 'timed out'):
+				# multi-line reason
+				self.failure['reason'] += "\n%s" % line
+			return
+		# summaries are authoritative
+		m = self.regex['all_passed'].search(line)
+		if m != None:
+			self.set_summary(int(m.group(1)), 0, 0)
+			return
+		if self.regex['one_passed'].match(line) != None:
+			self.set_summary(1, 0, 0)
+			return
+		m = self.regex['summary'].search(line)
+		if m != None:
+			self.set_summary(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+			return
+		if self.regex['no_tests'].search(line) != None: self.set_summary(0, 0, 0)
+
+	def set_summary(self, passed, failed, skipped):
+		self.passed, self.failed, self.skipped = (passed, failed, skipped)
+		self.completed = True
+
+
+# common test output parser
+class SublimErlCtOutputParser(SublimErlOutputParser):
+
+	regex = {
+		'failed_case': re.compile(r"^%%% (\S+) ==> (\S+): FAILED"),
+		'failure_reason': re.compile(r"^%%% (\S+) ==> (.*)$"),
+		'completed': re.compile(r"(\d+) ok, (\d+) failed(?:, (\d+) skipped)? of \d+ test cases"),
+		'done': re.compile(r"^\s*DONE\."),
+		'error': re.compile(r"ERROR: One or more tests failed")
+	}
+
+	def __init__(self, on_update=None):
+		SublimErlOutputParser.__init__(self, on_update)
+		# failure whose reason is expected on the next line
+		self.failure = None
+		self.errors = False
+		# number of suite summaries seen
+		self.summaries = 0
+
+	def parse_line(self, line):
+		m = self.regex['failed_case'].match(line)
+		if m != None:
+			self.failure = self.add_failure(m.group(1), m.group(2), 'failed')
+			return
+		if self.failure != None:
+			m = self.regex['failure_reason'].match(line)
+			if m != None: self.failure['reason'] = m.group(2)
+			self.failure = None
+			return
+		m = self.regex['completed'].search(line)
+		if m != None:
+			# one line per suite
+			self.summaries += 1
+			self.passed += int(m.group(1))
+			self.failed += int(m.group(2))
+			if m.group(3) != None: self.skipped += int(m.group(3))
+			return
+		if self.regex['done'].match(line) != None: self.completed = True
+		elif self.regex['error'].search(line) != None: self.errors = True
+
+
+# dialyzer output parser: warnings are reported as failures
+class SublimErlDialyzerOutputParser(SublimErlOutputParser):
+
+	regex = {
+		'warning': re.compile(r"^([^:\s]+\.[eh]rl):(\d+): (.*)$"),
+		'passed': re.compile(r"passed successfully"),
+		'done': re.compile(r"^\s*done \(")
+	}
+
+	def __init__(self, on_update=None):
+		SublimErlOutputParser.__init__(self, on_update)
+		self.success = False
+
+	def parse_line(self, line):
+		m = self.regex['warning'].match(line)
+		if m != None:
+			self.failed += 1
+			filename = m.group(1).split('/')[-1]
+			failure = self.add_failure(filename[:-len('.erl')], None, m.group(3), int(m.group(2)))
+			# warnings may be in headers
+			failure['file'] = filename
+			return
+		if self.regex['passed'].search(line) != None: self.success = True
+		if self.regex['done'].match(line) != None: self.completed = True
@@ -29,8 +29,231 @@
 
 # imports
 import sublime
-import os, subprocess, re, threading, webbrowser
-from sublimerl_core import SUBLIMERL_VERSION, SUBLIMERL, SublimErlTextCommand, SublimErlProjectLoader
+import os, subprocess, signal, re, fnmatch, glob, hashlib, pickle, time, threading, webbrowser, Queue
+from sublimerl_core import SUBLIMERL_VERSION, SUBLIMERL, SublimErlTextCommand, SublimErlProjectLoader, SublimErlPanel
+from sublimerl_includes import get_include_graph
+from sublimerl_beam_cache import SUBLIMERL_BEAM_CACHE
+from sublimerl_completion import SublimErlIndexes
+from sublimerl_dialyzer import SUBLIMERL_DIALYZER_CACHE, get_plt
+from sublimerl_test_parsers import SUBLIMERL_TEST_PROGRESS, SublimErlEunitOutputParser, SublimErlCtOutputParser, SublimErlDialyzerOutputParser
+
+# warm eunit test nodes, by app root and worker
+SUBLIMERL_TEST_NODES = {}
+# test sessions, by project root
+SUBLIMERL_TEST_SESSIONS = {}
+
+
+# persistent erlang node running the eunit tests of an app: only the beams that changed get reloaded between runs
+class SublimErlTestNode():
+
+	def __init__(self, project_root, app_root):
+		# init
+		self.project_root = project_root
+		self.app_root = app_root
+		self.process = None
+		self.lock = threading.Lock()
+
+	def start(self, env):
+		server_path = os.path.join(SUBLIMERL.support_path, 'sublimerl_test_server.erl')
+		self.process = subprocess.Popen([SUBLIMERL.escript_path, server_path, self.project_root, self.app_root], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, preexec_fn=os.setsid)
+
+	def stop(self):
+		if self.process != None and self.process.poll() == None:
+			try:
+				os.killpg(self.process.pid, signal.SIGTERM)
+			except OSError:
+				pass
+		self.process = None
+
+	def run(self, loader, module_name, function_name=None, log=True, parser=None):
+		# run tests, logging the output as it streams: returns (retcode, output)
+		self.lock.acquire()
+		try:
+			if self.process == None or self.process.poll() != None: self.start(loader.get_test_env())
+			stdout = []
+			try:
+				self.process.stdin.write("%s\n" % ' '.join([name for name in (module_name, function_name) if name != None]))
+				self.process.stdin.flush()
+				for line in iter(self.process.stdout.readline, ''):
+					if line.startswith('sublimerl_test_server '):
+						retcode = 0 if line.strip().endswith(' ok') else 1
+						if parser != None: return (retcode, parser.get_output())
+						return (retcode, ''.join(stdout))
+					if log == True: loader.log(line)
+					if parser != None: parser.feed(line)
+					else: stdout.append(line)
+			except (IOError, OSError, ValueError):
+				pass
+			# the node died
+			self.stop()
+			if parser != None: return (1, parser.get_output())
+			return (1, ''.join(stdout))
+		finally:
+			self.lock.release()
+
+
+def get_test_node(project_root, app_root, worker=0):
+	global SUBLIMERL_TEST_NODES
+	if not SUBLIMERL_TEST_NODES.has_key((app_root, worker)):
+		SUBLIMERL_TEST_NODES[(app_root, worker)] = SublimErlTestNode(project_root, app_root)
+	return SUBLIMERL_TEST_NODES[(app_root, worker)]
+
+
+# durations and outcomes of the previous test runs of a project, by test id
+class SublimErlTestHistory():
+
+	def __init__(self, project_root):
+		# init
+		self.history_path = os.path.join(SUBLIMERL.cache_path, 'tests', "%s.history" % hashlib.sha1(project_root).hexdigest())
+		# test id -> list of (time, duration, outcome), oldest first
+		self.tests = {}
+		if os.path.exists(self.history_path):
+			f = open(self.history_path, 'rb')
+			self.tests = pickle.load(f)
+			f.close()
+
+	def record(self, test_id, duration, outcome):
+		runs = self.tests.setdefault(test_id, [])
+		runs.append((time.time(), duration, outcome))
+		del runs[:-SUBLIMERL.settings.get('test_history_size', 20)]
+
+	def record_results(self, results):
+		# (module, test, outcome, duration) reported by an eunit output parser
+		for module_name, test, outcome, duration in results:
+			if module_name != None and test != None: self.record("%s:%s" % (module_name, test), duration, outcome)
+
+	def get_durations(self, test_id):
+		return [duration for t, duration, outcome in self.tests.get(test_id, []) if duration != None]
+
+	def get_duration(self, test_id):
+		# median duration, unknown tests are considered slow so that they get scheduled first
+		durations = self.get_durations(test_id)
+		if len(durations) == 0: return 3600
+		return self.median(durations)
+
+	def median(self, values):
+		values = sorted(values)
+		if len(values) % 2 == 1: return values[len(values) / 2]
+		return (values[len(values) / 2 - 1] + values[len(values) / 2]) / 2.0
+
+	def has_failed_last(self, test_id):
+		runs = self.tests.get(test_id, [])
+		return len(runs) > 0 and runs[-1][2] == 'failed'
+
+	def get_flips(self, test_id):
+		# number of times the outcome changed between passed and failed
+		outcomes = [outcome for t, duration, outcome in self.tests.get(test_id, []) if outcome in ('passed', 'failed')]
+		return len([i for i in range(1, len(outcomes)) if outcomes[i] != outcomes[i - 1]])
+
+	def get_flaky_tests(self):
+		# tests that both passed and failed more than once recently
+		return sorted([test_id for test_id in self.tests.keys() if self.get_flips(test_id) >= 2], key=lambda test_id: -self.get_flips(test_id))
+
+	def get_slowest_tests(self, count):
+		timed = [test_id for test_id in self.tests.keys() if len(self.get_durations(test_id)) > 0]
+		return sorted(timed, key=lambda test_id: -self.get_duration(test_id))[:count]
+
+	def get_regressions(self):
+		# (test id, last duration, previous median) of tests whose last run was much slower than usual
+		regressions = []
+		for test_id in self.tests.keys():
+			durations = self.get_durations(test_id)
+			if len(durations) < 4: continue
+			median = self.median(durations[:-1])
+			if durations[-1] > 1.5 * median and durations[-1] - median > 0.01: regressions.append((test_id, durations[-1], median))
+		return sorted(regressions, key=lambda regression: regression[2] - regression[1])
+
+	def save(self):
+		if not os.path.exists(os.path.dirname(self.history_path)): os.makedirs(os.path.dirname(self.history_path))
+		f = open(self.history_path, 'wb')
+		pickle.dump(self.tests, f)
+		f.close()
+
+
+# tests of a project: they run one at a time, the ones started meanwhile get queued
+class SublimErlTestSession():
+
+	def __init__(self, project_root):
+		# init
+		self.project_root = project_root
+		self.last_test = None
+		self.last_test_type = None
+		self.busy = False
+		self.runner = None
+		# list of (view, runner class, new) waiting for the running test to end
+		self.pending = []
+		self.timer = None
+		self.lock = threading.Lock()
+
+	def submit(self, view, runner_class, new=True):
+		self.lock.acquire()
+		try:
+			if self.busy == True:
+				self.pending.append((view, runner_class, new))
+				sublime.status_message("SublimErl: test queued, %d waiting." % len(self.pending))
+				return
+			self.busy = True
+		finally:
+			self.lock.release()
+		self.start(view, runner_class, new)
+
+	def start(self, view, runner_class, new):
+		# called from the main thread, since runners setup their panel
+		runner = runner_class(view)
+		self.runner = runner
+		if runner.initialized == False:
+			self.on_test_ended(runner)
+			return
+		timeout = SUBLIMERL.settings.get('test_timeout', 600)
+		if timeout > 0:
+			self.timer = threading.Timer(timeout, self.on_timeout, [runner])
+			self.timer.daemon = True
+			self.timer.start()
+		if runner.start_test(new=new) == False: self.on_test_ended(runner)
+
+	def on_timeout(self, runner):
+		if self.runner is runner: runner.cancel('TIMED OUT')
+
+	def cancel(self):
+		# kill the running test, and forget the queued ones
+		self.lock.acquire()
+		try:
+			self.pending = []
+			runner = self.runner
+		finally:
+			self.lock.release()
+		if runner != None: runner.cancel('CANCELLED')
+
+	def on_test_ended(self, runner):
+		self.lock.acquire()
+		try:
+			# a cancelled test ends twice
+			if self.runner is not runner: return
+			self.runner = None
+			if self.timer != None:
+				self.timer.cancel()
+				self.timer = None
+			if len(self.pending) == 0:
+				self.busy = False
+				return
+			view, runner_class, new = self.pending.pop(0)
+		finally:
+			self.lock.release()
+		sublime.set_timeout(lambda: self.start(view, runner_class, new), 0)
+
+
+def get_test_session(project_root):
+	global SUBLIMERL_TEST_SESSIONS
+	if not SUBLIMERL_TEST_SESSIONS.has_key(project_root):
+		SUBLIMERL_TEST_SESSIONS[project_root] = SublimErlTestSession(project_root)
+	return SUBLIMERL_TEST_SESSIONS[project_root]
+
+
+def get_view_test_session(view):
+	# session of the project of the view, None if the view is not part of a project
+	loader = SublimErlProjectLoader(view)
+	if loader.project_root == None: return None
+	return get_test_session(loader.project_root)
 
 
 # test runner
@@ -42,39 +265,37 @@ class SublimErlTestRunner(SublimErlProjectLoader):
 
 		# init
 		self.initialized = False
+		self.cancelled = False
 		self.panel_name = 'sublimerl_tests'
-		self.panel_buffer = ''
-
-		# don't proceed if a test is already running
-		global SUBLIMERL
-		if SUBLIMERL.test_in_progress == True: return
-		SUBLIMERL.test_in_progress = True
+		self.session = None
+		if self.project_root != None: self.session = get_test_session(self.project_root)
 
 		# setup panel
 		self.setup_panel()
 		# run
 		if self.init_tests() == True:
 			self.initialized = True
-		else:
-			SUBLIMERL.test_in_progress = False
 
 	def setup_panel(self):
-		self.panel = self.window.get_output_panel(self.panel_name)
-		self.panel.settings().set("syntax", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlTests.hidden-tmLanguage"))
-		self.panel.settings().set("color_scheme", os.path.join(SUBLIMERL.plugin_path, "theme", "SublimErlTests.hidden-tmTheme"))
-
-	def update_panel(self):
-		if len(self.panel_buffer):
-			panel_edit = self.panel.begin_edit()
-			self.panel.insert(panel_edit, self.panel.size(), self.panel_buffer)
-			self.panel.end_edit(panel_edit)
-			self.panel.show(self.panel.size())
-			self.panel_buffer = ''
-			self.window.run_command("show_panel", {"panel": "output.%s" % self.panel_name})
+		self.panel = SublimErlPanel(self.window, self.panel_name, 'SublimErlTests')
 
 	def log(self, text):
-		self.panel_buffer += text.encode('utf-8')
-		sublime.set_timeout(self.update_panel, 0)
+		# a cancelled test may still be winding down while the next one logs
+		if self.cancelled == False: self.panel.write(text)
+
+	def execute_os_command(self, os_cmd, dir_type=None, block=False, log=True, parser=None):
+		# nothing gets started once cancelled
+		if self.cancelled == True: return (1, '')
+		return SublimErlProjectLoader.execute_os_command(self, os_cmd, dir_type, block, log, parser)
+
+	def cancel(self, reason):
+		self.log("\n=> TEST(S) %s.\n" % reason)
+		self.cancelled = True
+		self.kill_processes()
+		# the warm nodes may be in the middle of a run
+		for node in SUBLIMERL_TEST_NODES.values():
+			if node.project_root == self.project_root: node.stop()
+		self.on_test_ended()
 
 	def log_error(self, error_text):
 		self.log("Error => %s\n[ABORTED]\n" % error_text)
@@ -104,57 +325,110 @@ class SublimErlTestRunner(SublimErlProjectLoader):
 		# all ok
 		return True
 
-	def compile_eunit_no_run(self):
-		# call rebar to compile -  HACK: passing in a non-existing suite forces rebar to not run the test suite
-		os_cmd = '%s eunit suites=sublimerl_unexisting_test' % SUBLIMERL.rebar_path
-		if self.app_name: os_cmd += ' apps=%s' % self.app_name
-		retcode, data = self.execute_os_command(os_cmd, dir_type='project', block=True, log=False)
-
-		if re.search(r"There were no tests to run", data) != None:
-			# expected error returned (due to the hack)
-			return 0
-		# send the data to panel
-		self.log(data)
+	def compile_eunit_module(self, module_name):
+		# compile a single module to .eunit, preceded by the stale parse transforms it needs: rebar eunit would recompile the whole app
+		stale_paths = self.get_stale_eunit_modules()
+		stale_modules = dict([(os.path.splitext(os.path.basename(p))[0], p) for p in stale_paths])
+		if module_name not in stale_modules:
+			if os.path.exists(os.path.join(self.test_root, '.eunit', "%s.beam" % module_name)): return True
+			self.log_error("Cannot find the source of module \"%s\"." % module_name)
+			return False
+		module_path = stale_modules[module_name]
+		f = open(module_path, 'r')
+		module = SUBLIMERL.strip_comments(f.read())
+		f.close()
+		module_paths = []
+		for m in re.finditer(r"parse_transform\s*,\s*'?([a-z][a-zA-Z0-9_@]*)'?", module):
+			if m.group(1) in stale_modules and stale_modules[m.group(1)] not in module_paths: module_paths.append(stale_modules[m.group(1)])
+		module_paths.append(module_path)
+		return self.compile_eunit_modules(module_paths)
+
+	def get_app_roots(self):
+		# the project and its apps, not its deps
+		app_roots = [self.project_root]
+		apps_path = os.path.join(self.project_root, 'apps')
+		if os.path.isdir(apps_path): app_roots.extend([os.path.join(apps_path, name) for name in sorted(os.listdir(apps_path))])
+		return [app_root for app_root in app_roots if os.path.isdir(os.path.join(app_root, 'src'))]
+
+	def has_stale_ebin_modules(self):
+		# True if a source of the project has no beam in ebin, or one older than it or than one of its includes
+		include_graph = get_include_graph(self.project_root)
+		for app_root in self.get_app_roots():
+			for root, dirnames, filenames in os.walk(os.path.join(app_root, 'src')):
+				for filename in fnmatch.filter(filenames, r"*.erl"):
+					module_path = os.path.join(root, filename)
+					beam_path = os.path.join(app_root, 'ebin', "%s.beam" % os.path.splitext(filename)[0])
+					if not os.path.exists(beam_path): return True
+					beam_mtime = os.path.getmtime(beam_path)
+					source_paths = [module_path] + include_graph.get_transitive_includes(module_path)
+					if True in [os.path.getmtime(p) > beam_mtime for p in source_paths if os.path.exists(p)]: return True
+		return False
+
+	def get_stale_eunit_modules(self, app_root=None):
+		# sources of the app whose .eunit beam is missing, or older than them or than one of their includes
+		if app_root == None: app_root = self.test_root
+		eunit_path = os.path.join(app_root, '.eunit')
+		include_graph = get_include_graph(self.project_root)
+		module_paths = []
+		for dir_name in ('src', 'test'):
+			for root, dirnames, filenames in os.walk(os.path.join(app_root, dir_name)):
+				for filename in fnmatch.filter(filenames, r"*.erl"):
+					module_path = os.path.join(root, filename)
+					beam_path = os.path.join(eunit_path, "%s.beam" % os.path.splitext(filename)[0])
+					if os.path.exists(beam_path):
+						beam_mtime = os.path.getmtime(beam_path)
+						source_paths = [module_path] + include_graph.get_transitive_includes(module_path)
+						if not (True in [os.path.getmtime(p) > beam_mtime for p in source_paths if os.path.exists(p)]): continue
+					module_paths.append(module_path)
+		return module_paths
+
+	def compile_eunit_modules(self, module_paths, app_root=None):
+		# compile to .eunit with the flags rebar eunit uses
+		if app_root == None: app_root = self.test_root
+		eunit_path = os.path.join(app_root, '.eunit')
+		if not os.path.exists(eunit_path): os.makedirs(eunit_path)
+		for module_path in module_paths:
+			retcode, data = SUBLIMERL_BEAM_CACHE.compile_module(self, module_path, eunit_path, ['-DTEST', '+debug_info'], app_root)
+			if retcode != 0:
+				self.log(data)
+				return False
+		return True
 
 	def reset_last_test(self):
-		global SUBLIMERL
-
-		SUBLIMERL.last_test = None
-		SUBLIMERL.last_test_type = None
+		self.session.last_test = None
+		self.session.last_test_type = None
 
 	def start_test(self, new=True):
 		# do not continue if no previous test exists and a redo was asked
-		if SUBLIMERL.last_test == None and new == False: return
+		if self.session.last_test == None and new == False: return False
 		# set test
 		if new == True: self.reset_last_test()
 		# test callback
 		self.log("Starting tests (SublimErl v%s).\n" % SUBLIMERL_VERSION)
 		self.start_test_cmd(new)
+		return True
 
 	def start_test_cmd(self, new):
 		# placeholder for inheritance
 		pass
 
 	def on_test_ended(self):
-		global SUBLIMERL
-		SUBLIMERL.test_in_progress = False
+		if self.session != None: self.session.on_test_ended(self)
 
 
 # dialyzer test runner
 class SublimErlDialyzerTestRunner(SublimErlTestRunner):
 
 	def start_test_cmd(self, new):
-		global SUBLIMERL
-
 		if new == True:
 			# save test module
 			module_tests_name = self.erlang_module_name
 
-			SUBLIMERL.last_test = module_tests_name
-			SUBLIMERL.last_test_type = 'dialyzer'
+			self.session.last_test = module_tests_name
+			self.session.last_test_type = 'dialyzer'
 		else:
 			# retrieve test module
-			module_tests_name = SUBLIMERL.last_test
+			module_tests_name = self.session.last_test
 
 		# run test
 		this = self
@@ -167,16 +441,39 @@ class SublimErlDialyzerTestRunner(SublimErlTestRunner):
 	def dialyzer_test(self, module_tests_name, filename):
 		# run dialyzer for file
 		self.log("Running Dialyzer tests for \"%s\".\n\n" % filename)
-		# compile eunit
-		self.compile_eunit_no_run()
-		# run dialyzer
-		retcode, data = self.execute_os_command('%s -n .eunit/%s.beam' % (SUBLIMERL.dialyzer_path, module_tests_name), dir_type='test', block=False)
+		# compile the module with eunit flags
+		if self.compile_eunit_module(module_tests_name) == False:
+			self.log("\n=> TEST(S) FAILED.\n")
+			self.on_test_ended()
+			return
+		# run dialyzer, with the project plt if it can be built
+		plt_path = get_plt(self.project_root).ensure(self.log)
+		beam_path = os.path.join(self.test_root, '.eunit', "%s.beam" % module_tests_name)
+		parser = SublimErlDialyzerOutputParser()
+		if plt_path != None and os.path.exists(beam_path):
+			# unchanged beams are answered from cache
+			entry = SUBLIMERL_DIALYZER_CACHE.get(beam_path, plt_path)
+			if entry != None:
+				self.log("Dialyzer results of an unchanged module, from cache.\n\n")
+				for warning in entry['warnings']:
+					self.log("%s:%d: %s\n" % (warning['file'], warning['line'], warning['reason']))
+				parser.failures = entry['warnings']
+				parser.failed = len(entry['warnings'])
+				parser.success = entry['success']
+				parser.completed = True
+				self.interpret_test_results(0, parser)
+				return
+		os_cmd = '%s -n .eunit/%s.beam' % (SUBLIMERL.dialyzer_path, module_tests_name)
+		if plt_path != None: os_cmd = '%s --plt %s -n .eunit/%s.beam' % (SUBLIMERL.dialyzer_path, self.shellquote(plt_path), module_tests_name)
+		retcode, data = self.execute_os_command(os_cmd, dir_type='test', block=False, parser=parser)
+		if plt_path != None and parser.completed == True and os.path.exists(beam_path):
+			SUBLIMERL_DIALYZER_CACHE.set(beam_path, plt_path, parser.success, parser.failures)
 		# interpret
-		self.interpret_test_results(retcode, data)
+		self.interpret_test_results(retcode, parser)
 
-	def interpret_test_results(self, retcode, data):
+	def interpret_test_results(self, retcode, parser):
 		# get outputs
-		if re.search(r"passed successfully", data):
+		if parser.success == True:
 			self.log("\n=> TEST(S) PASSED.\n")
 		else:
 			self.log("\n=> TEST(S) FAILED.\n")
@@ -189,8 +486,6 @@ class SublimErlDialyzerTestRunner(SublimErlTestRunner):
 class SublimErlEunitTestRunner(SublimErlTestRunner):
 
 	def start_test_cmd(self, new):
-		global SUBLIMERL
-
 		# run test
 		if new == True:
 			# get test module name
@@ -207,12 +502,12 @@ class SublimErlEunitTestRunner(SublimErlTestRunner):
 
 			# save test
 			module_tests_name = self.erlang_module_name
-			SUBLIMERL.last_test = (module_name, module_tests_name, function_name)
-			SUBLIMERL.last_test_type = 'eunit'
+			self.session.last_test = (module_name, module_tests_name, function_name)
+			self.session.last_test_type = 'eunit'
 
 		else:
 			# retrieve test info
-			module_name, module_tests_name, function_name = SUBLIMERL.last_test
+			module_name, module_tests_name, function_name = self.session.last_test
 
 		# run test
 		this = self
@@ -250,6 +545,10 @@ class SublimErlEunitTestRunner(SublimErlTestRunner):
 			self.compile_eunit_run_suite(module_tests_name)
 
 	def compile_eunit_run_suite(self, suite, function_name=None):
+		if SUBLIMERL.settings.get('eunit_test_node', False) == True:
+			self.compile_eunit_run_suite_on_test_node(suite, function_name)
+			return
+
 		os_cmd = '%s eunit suites=%s' % (SUBLIMERL.rebar_path, suite)
 
 		if function_name != None: os_cmd += ' tests=%s' % function_name
@@ -257,86 +556,400 @@ class SublimErlEunitTestRunner(SublimErlTestRunner):
 
 		os_cmd += ' skip_deps=true'
 
-		retcode, data = self.execute_os_command(os_cmd, dir_type='project', block=False)
+		parser = SublimErlEunitOutputParser()
+		retcode, data = self.execute_os_command(os_cmd, dir_type='project', block=False, parser=parser)
+		# rebar's run time includes compilation, only the times reported by eunit are kept
+		self.record_history(suite, function_name, parser, verbose=False)
 		# interpret
-		self.interpret_test_results(retcode, data)
+		self.interpret_test_results(retcode, parser)
+
+	def record_history(self, suite, function_name, parser, duration=None, verbose=True):
+		if parser.completed == False: return
+		history = SublimErlTestHistory(self.project_root)
+		# non verbose output only reports the failing tests, their later passes would never be recorded
+		if verbose == True: history.record_results(parser.results)
+		outcome = 'failed' if parser.failed > 0 else 'passed'
+		if function_name != None:
+			if verbose == False or len(parser.results) == 0: history.record("%s:%s" % (suite, function_name), duration, outcome)
+		else:
+			history.record(suite, duration, outcome)
+		history.save()
 
-	def interpret_test_results(self, retcode, data):
+	def compile_eunit_run_suite_on_test_node(self, suite, function_name=None):
+		# compile the modules that changed, then run on the warm node of the app
+		if self.compile_eunit_modules(self.get_stale_eunit_modules()) == False:
+			self.log("\n=> TEST(S) FAILED.\n")
+			self.on_test_ended()
+			return
+		parser = SublimErlEunitOutputParser()
+		start = time.time()
+		retcode, data = get_test_node(self.project_root, self.test_root).run(self, suite, function_name, parser=parser)
+		self.record_history(suite, function_name, parser, time.time() - start)
+		# interpret
+		self.interpret_test_results(retcode, parser)
+
+	def interpret_test_results(self, retcode, parser):
+		SUBLIMERL_TEST_PROGRESS.show(parser.passed, parser.failed, parser.skipped, force=True)
 		# get outputs
-		if re.search(r"Test passed.", data):
+		if parser.completed == False:
+			self.log(parser.get_output())
+			self.log("\n=> TEST(S) FAILED.\n")
+
+		elif parser.failed > 0:
+			# some tests failed
+			self.log("\nFailures:\n%s" % parser.format_failures())
+			self.log("\n=> %s TEST(S) FAILED.\n" % parser.failed)
+
+		elif parser.passed == 1:
 			# single test passed
 			self.log("\n=> TEST PASSED.\n")
 
-		elif re.search(r"All \d+ tests passed.", data):
+		elif parser.passed > 1:
 			# multiple tests passed
-			passed_count = re.search(r"All (\d+) tests passed.", data).group(1)
-			self.log("\n=> %s TESTS PASSED.\n" % passed_count)
+			self.log("\n=> %s TESTS PASSED.\n" % parser.passed)
 
-		elif re.search(r"Failed: \d+.", data):
-			# some tests failed
-			failed_count = re.search(r"Failed: (\d+).", data).group(1)
-			self.log("\n=> %s TEST(S) FAILED.\n" % failed_count)
-
-		elif re.search(r"There were no tests to run.", data):
+		else:
 			self.log("\n=> NO TESTS TO RUN.\n")
 
+		# free test
+		self.on_test_ended()
+
+
+# project test runner: runs the tests of all the apps of the project
+class SublimErlProjectTestRunner(SublimErlTestRunner):
+
+	test_type = None
+
+	def init_tests(self):
+		if SUBLIMERL.initialized == False:
+			self.log("SublimErl could not be initialized:\n\n%s\n" % '\n'.join(SUBLIMERL.init_errors))
+
+		# save project's root paths
+		if self.project_root == None:
+			self.log_error("This code does not seem to be part of an OTP compilant project.")
+			return False
+
+		# all ok
+		return True
+
+	def start_test_cmd(self, new):
+		# save test
+		self.session.last_test = self.project_root
+		self.session.last_test_type = self.test_type
+
+		# run test
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.project_test()
+		SublimErlThread().start()
+
+	def project_test(self):
+		# placeholder for inheritance
+		pass
+
+	def get_counts(self):
+		# (passed, failed, skipped) of all the modules run so far
+		counts = [0, 0, 0]
+		for parser in list(self.parsers):
+			counts = [counts[0] + parser.passed, counts[1] + parser.failed, counts[2] + parser.skipped]
+		return counts
+
+	def show_progress(self):
+		passed, failed, skipped = self.get_counts()
+		SUBLIMERL_TEST_PROGRESS.show(passed, failed, skipped)
+
+	def interpret_test_results(self):
+		passed, failed, skipped = self.counts
+		SUBLIMERL_TEST_PROGRESS.show(passed, failed, skipped, force=True)
+		if failed > 0:
+			failures = ''.join([parser.format_failures() for parser in self.parsers])
+			if len(failures) > 0: self.log("\nFailures:\n%s" % failures)
+			self.log("\n=> %s TEST(S) FAILED.\n" % failed)
+		elif passed == 1:
+			self.log("\n=> TEST PASSED.\n")
+		elif passed > 1:
+			self.log("\n=> %s TESTS PASSED.\n" % passed)
 		else:
-			self.log(data)
-			self.log("\n=> TEST(S) FAILED.\n")
+			self.log("\n=> NO TESTS TO RUN.\n")
 
 		# free test
 		self.on_test_ended()
 
 
+# project eunit test runner: test modules are spread over parallel warm nodes
+class SublimErlEunitProjectTestRunner(SublimErlProjectTestRunner):
+
+	tests_description = 'all'
+	test_type = 'eunit_project'
+
+	def stop_idle_nodes(self):
+		# only the first node of each app is reused by single module runs, and only if they run on warm nodes
+		keep_first = SUBLIMERL.settings.get('eunit_test_node', False) == True
+		for (app_root, worker), node in SUBLIMERL_TEST_NODES.items():
+			if node.project_root == self.project_root and (worker > 0 or keep_first == False): node.stop()
+
+	def get_test_modules(self, app_root):
+		# modules with tests: eunit runs the tests of <module>_tests along with the ones of <module>
+		module_paths = {}
+		for dir_name in ('src', 'test'):
+			for root, dirnames, filenames in os.walk(os.path.join(app_root, dir_name)):
+				for filename in fnmatch.filter(filenames, r"*.erl"):
+					module_paths[os.path.splitext(filename)[0]] = os.path.join(root, filename)
+		test_modules = []
+		for module_name in sorted(module_paths.keys()):
+			if module_name.endswith('_tests'):
+				if not module_paths.has_key(module_name[:-len('_tests')]): test_modules.append(module_name)
+				continue
+			if module_paths.has_key("%s_tests" % module_name):
+				test_modules.append(module_name)
+				continue
+			f = open(module_paths[module_name], 'r')
+			module = f.read()
+			f.close()
+			if re.search(r"^\s*-\s*include(?:_lib)?\s*\(\s*\"[^\"]*eunit\.hrl\"", module, re.MULTILINE) != None: test_modules.append(module_name)
+		return test_modules
+
+	def get_sources_snapshot(self):
+		# hashes of the sources of the project and of its apps
+		snapshot = {}
+		for app_root in self.get_app_roots():
+			for dir_name in ('src', 'test', 'include'):
+				for root, dirnames, filenames in os.walk(os.path.join(app_root, dir_name)):
+					for filename in filenames:
+						if os.path.splitext(filename)[1] not in ('.erl', '.hrl'): continue
+						filepath = os.path.join(root, filename)
+						f = open(filepath, 'rb')
+						snapshot[filepath] = hashlib.sha1(f.read()).hexdigest()
+						f.close()
+		return snapshot
+
+	def get_green_snapshot_path(self):
+		return os.path.join(SUBLIMERL.cache_path, 'tests', "%s.green" % hashlib.sha1(self.project_root).hexdigest())
+
+	def save_green_snapshot(self, snapshot):
+		# sources of the last run without failures
+		green_path = self.get_green_snapshot_path()
+		if not os.path.exists(os.path.dirname(green_path)): os.makedirs(os.path.dirname(green_path))
+		f = open(green_path, 'wb')
+		pickle.dump(snapshot, f)
+		f.close()
+
+	def select_tasks(self, tasks, snapshot):
+		# placeholder for inheritance
+		return tasks
+
+	def project_test(self):
+		self.log("Running %s Eunit tests of project \"%s\".\n\n" % (self.tests_description, self.project_root))
+		snapshot = self.get_sources_snapshot()
+		# compile & list the test modules of every app
+		tasks = []
+		for app_root in self.get_app_roots():
+			if self.compile_eunit_modules(self.get_stale_eunit_modules(app_root), app_root) == False:
+				self.log("\n=> TEST(S) FAILED.\n")
+				self.on_test_ended()
+				return
+			tasks.extend([(app_root, module_name) for module_name in self.get_test_modules(app_root)])
+		tasks = self.select_tasks(tasks, snapshot)
+		# modules that failed last time first for quick feedback, then slowest first so that the workers end at about the same time
+		history = SublimErlTestHistory(self.project_root)
+		tasks.sort(key=lambda task: (not history.has_failed_last(task[1]), -history.get_duration(task[1])))
+		queue = Queue.Queue()
+		for task in tasks: queue.put(task)
+		self.counts = [0, 0, 0]
+		self.parsers = []
+		lock = threading.Lock()
+		this = self
+		class SublimErlThread(threading.Thread):
+			def __init__(self, worker):
+				threading.Thread.__init__(self)
+				self.worker = worker
+			def run(self):
+				while this.cancelled == False:
+					try:
+						app_root, module_name = queue.get_nowait()
+					except Queue.Empty:
+						return
+					start = time.time()
+					parser = SublimErlEunitOutputParser(this.show_progress)
+					this.parsers.append(parser)
+					retcode, data = get_test_node(this.project_root, app_root, self.worker).run(this, module_name, log=False, parser=parser)
+					duration = time.time() - start
+					# a module that could not be run counts as a failure
+					if parser.completed == False: parser.failed += 1
+					lock.acquire()
+					try:
+						history.record(module_name, duration, 'failed' if parser.failed > 0 else 'passed')
+						history.record_results(parser.results)
+						if parser.failed > 0: this.log(data)
+						this.log("%s: %d passed, %d failed, %d skipped (%.2fs).\n" % (module_name, parser.passed, parser.failed, parser.skipped, duration))
+					finally:
+						lock.release()
+		workers = [SublimErlThread(i) for i in range(min(len(tasks), SUBLIMERL.settings.get('eunit_workers', 4)))]
+		for worker in workers: worker.start()
+		for worker in workers: worker.join()
+		self.stop_idle_nodes()
+		history.save()
+		self.counts = self.get_counts()
+		if self.counts[1] == 0: self.save_green_snapshot(snapshot)
+		# interpret
+		self.interpret_test_results()
+
+
+# affected eunit test runner: only the test modules that depend on the sources changed since the last run without failures
+class SublimErlEunitAffectedTestRunner(SublimErlEunitProjectTestRunner):
+
+	tests_description = 'the affected'
+	test_type = 'eunit_affected'
+
+	def select_tasks(self, tasks, snapshot):
+		green_path = self.get_green_snapshot_path()
+		if not os.path.exists(green_path): return tasks
+		f = open(green_path, 'rb')
+		green_snapshot = pickle.load(f)
+		f.close()
+		changed_paths = [filepath for filepath in snapshot.keys() if green_snapshot.get(filepath) != snapshot[filepath]]
+		affected = self.get_affected_modules(changed_paths)
+		if affected == None: return tasks
+		# eunit runs <module>_tests along with <module>
+		return [(app_root, module_name) for app_root, module_name in tasks if module_name in affected or "%s_tests" % module_name in affected]
+
+	def get_affected_modules(self, changed_paths):
+		# modules that depend on the changed sources through includes and calls, None if the calls are not indexed
+		calls = SublimErlIndexes().get_calls()
+		if len(calls) == 0: return None
+		callers = {}
+		for module_name, (filepath, module_calls) in calls.items():
+			for (called_module, function, arity), line in module_calls:
+				if called_module != module_name: callers.setdefault(called_module, set()).add(module_name)
+		include_graph = get_include_graph(self.project_root)
+		pending = []
+		for changed_path in changed_paths:
+			if changed_path.endswith('.hrl'): module_paths = include_graph.get_dependent_modules(changed_path)
+			else: module_paths = [changed_path]
+			pending.extend([os.path.splitext(os.path.basename(module_path))[0] for module_path in module_paths])
+		affected = set()
+		while len(pending) > 0:
+			module_name = pending.pop()
+			if module_name in affected: continue
+			affected.add(module_name)
+			pending.extend(callers.get(module_name, []))
+		return affected
+
+
 # eunit test runner
 class SublimErlCtTestRunner(SublimErlTestRunner):
 
-	def start_test_cmd(self, new):
-		global SUBLIMERL
+	# functions of a suite that are not test cases
+	ct_callbacks = ('all', 'groups', 'suite', 'init_per_suite', 'end_per_suite', 'init_per_group', 'end_per_group', 'init_per_testcase', 'end_per_testcase')
 
+	def start_test_cmd(self, new):
 		# run test
 		if new == True:
 			pos = self.erlang_module_name.find("_SUITE")
 			module_tests_name = self.erlang_module_name[0:pos]
 
+			# get group and case depending on cursor position
+			group_name, case_name = self.get_ct_target()
+
 			# save test
-			SUBLIMERL.last_test = module_tests_name
-			SUBLIMERL.last_test_type = 'ct'
+			self.session.last_test = (module_tests_name, group_name, case_name)
+			self.session.last_test_type = 'ct'
 
 		else:
-			module_tests_name = SUBLIMERL.last_test
+			module_tests_name, group_name, case_name = self.session.last_test
 
 		# run test
 		this = self
 		class SublimErlThread(threading.Thread):
 			def run(self):
-				this.ct_test(module_tests_name)
+				this.ct_test(module_tests_name, group_name, case_name)
 		SublimErlThread().start()
 
-	def ct_test(self, module_tests_name):
+	def get_ct_target(self):
+		# (group, case) under the cursor, with None values to run the whole suite
+		cursor_position = self.view.sel()[0].a
+		region_full = sublime.Region(0, self.view.size())
+		module = SUBLIMERL.strip_code_for_parsing(self.view.substr(region_full))
+		# function the cursor is in
+		function_name = None
+		for m in re.finditer(r"^([a-z][a-zA-Z0-9_]*)\s*\(", module, re.MULTILINE):
+			if m.start() > cursor_position: break
+			function_name, function_end = m.group(1), m.end()
+		if function_name == None: return (None, None)
+		groups = self.get_ct_groups(module)
+		if function_name == 'groups':
+			# innermost group definition or reference
+			containing = [(start, name) for name, start, end in groups if start <= cursor_position and cursor_position < end]
+			if len(containing) == 0: return (None, None)
+			return (max(containing)[1], None)
+		if function_name in ('init_per_group', 'end_per_group'):
+			m = re.compile(r"\s*'?([a-z][a-zA-Z0-9_@]*)'?\s*,").match(module, function_end)
+			if m == None: return (None, None)
+			return (m.group(1), None)
+		if function_name in self.ct_callbacks: return (None, None)
+		# a test case, run within its group if it is not listed in all()
+		m = re.search(r"^all\s*\(\s*\)\s*->[^.]*\.", module, re.MULTILINE)
+		if m != None and function_name in re.findall(r"[a-z][a-zA-Z0-9_@]*", m.group(0)): return (None, function_name)
+		for name, start, end in groups:
+			if name in self.ct_callbacks or name == function_name: continue
+			if function_name in re.findall(r"[a-z][a-zA-Z0-9_@]*", module[start:end]): return (name, function_name)
+		return (None, function_name)
+
+	def get_ct_groups(self, module):
+		# groups defined or referenced in groups(): [(name, start, end)], where start and end delimit their tuple
+		groups = []
+		m = re.search(r"^groups\s*\(\s*\)\s*->[^.]*\.", module, re.MULTILINE)
+		if m == None: return groups
+		for g in re.compile(r"\{\s*'?([a-z][a-zA-Z0-9_@]*)'?\s*,").finditer(module, m.start(), m.end()):
+			name = g.group(1)
+			if name == 'group':
+				# {group, Name} reference
+				r = re.compile(r"\s*'?([a-z][a-zA-Z0-9_@]*)'?").match(module, g.end())
+				if r == None: continue
+				name = r.group(1)
+			# find the end of the tuple
+			depth = 0
+			for end in range(g.start(), m.end()):
+				if module[end] in '{[': depth += 1
+				elif module[end] in '}]': depth -= 1
+				if depth == 0: break
+			groups.append((name, g.start(), end + 1))
+		return groups
+
+	def ct_test(self, module_tests_name, group_name=None, case_name=None):
 		# run CT for suite
-		self.log("Running tests of Common Tests SUITE \"%s_SUITE.erl\".\n\n" % module_tests_name)
-		os_cmd = '%s ct suites=%s skip_deps=true' % (SUBLIMERL.rebar_path, module_tests_name)
-		# compile all source code
-		self.compile_source()
+		if case_name != None:
+			self.log("Running test case \"%s\" of Common Tests SUITE \"%s_SUITE.erl\".\n\n" % (case_name, module_tests_name))
+		elif group_name != None:
+			self.log("Running group \"%s\" of Common Tests SUITE \"%s_SUITE.erl\".\n\n" % (group_name, module_tests_name))
+		else:
+			self.log("Running tests of Common Tests SUITE \"%s_SUITE.erl\".\n\n" % module_tests_name)
+		os_cmd = '%s ct suites=%s' % (SUBLIMERL.rebar_path, module_tests_name)
+		if group_name != None: os_cmd += ' group=%s' % group_name
+		if case_name != None: os_cmd += ' case=%s' % case_name
+		os_cmd += ' skip_deps=true'
+		# compile all source code, unless nothing changed since the last compile
+		if self.has_stale_ebin_modules() == True: self.compile_source()
 		# run suite
-		retcode, data = self.execute_os_command(os_cmd, dir_type='test', block=False)
+		parser = SublimErlCtOutputParser()
+		retcode, data = self.execute_os_command(os_cmd, dir_type='test', block=False, parser=parser)
 		# interpret
-		self.interpret_test_results(retcode, data)
+		self.interpret_test_results(retcode, parser)
 
-	def interpret_test_results(self, retcode, data):
+	def interpret_test_results(self, retcode, parser):
+		SUBLIMERL_TEST_PROGRESS.show(parser.passed, parser.failed, parser.skipped, force=True)
 		# get outputs
-		if re.search(r"DONE.", data):
+		if parser.completed == True and parser.failed == 0:
 			# test passed
-			passed_count = re.search(r"(\d+) ok, 0 failed(?:, 1 skipped)? of \d+ test cases", data).group(1)
-			if int(passed_count) > 0:
-				self.log("=> %s TEST(S) PASSED.\n" % passed_count)
+			if parser.passed > 0:
+				self.log("=> %s TEST(S) PASSED.\n" % parser.passed)
 			else:
 				self.log("=> NO TESTS TO RUN.\n")
 
-		elif re.search(r"ERROR: One or more tests failed", data):
-			failed_count = re.search(r"\d+ ok, (\d+) failed(?:, 1 skipped)? of \d+ test cases", data).group(1)
-			self.log("\n=> %s TEST(S) FAILED.\n" % failed_count)
+		elif parser.errors == True and parser.failed > 0:
+			if len(parser.failures) > 0: self.log("\nFailures:\n%s" % parser.format_failures())
+			self.log("\n=> %s TEST(S) FAILED.\n" % parser.failed)
 
 		else:
 			self.log("\n=> TEST(S) FAILED.\n")
@@ -345,25 +958,149 @@ class SublimErlCtTestRunner(SublimErlTestRunner):
 		self.on_test_ended()
 
 
+# project CT runner: suites run in parallel, each one with its own log dir
+class SublimErlCtProjectTestRunner(SublimErlProjectTestRunner):
+
+	test_type = 'ct_project'
+
+	def get_suites(self, app_root):
+		suite_paths = []
+		for root, dirnames, filenames in os.walk(os.path.join(app_root, 'test')):
+			suite_paths.extend([os.path.join(root, filename) for filename in fnmatch.filter(filenames, r"*_SUITE.erl")])
+		return sorted(suite_paths)
+
+	def compile_test_modules(self, app_root):
+		# compile the suites and their helpers next to their sources, so that the parallel runs do not compile them concurrently
+		for root, dirnames, filenames in os.walk(os.path.join(app_root, 'test')):
+			for filename in fnmatch.filter(filenames, r"*.erl"):
+				retcode, data = SUBLIMERL_BEAM_CACHE.compile_module(self, os.path.join(root, filename), root, ['+debug_info'], app_root)
+				if retcode != 0:
+					self.log(data)
+					return False
+		return True
+
+	def run_suite(self, app_root, suite_path, parser):
+		suite_name = os.path.splitext(os.path.basename(suite_path))[0]
+		log_dir = os.path.join(app_root, 'logs', suite_name)
+		if not os.path.exists(log_dir): os.makedirs(log_dir)
+		code_paths = [os.path.join(app_root, 'ebin'), os.path.dirname(suite_path)]
+		code_paths.extend(glob.glob(os.path.join(self.project_root, 'deps', '*', 'ebin')))
+		code_paths.extend(glob.glob(os.path.join(self.project_root, 'apps', '*', 'ebin')))
+		ct_run_path = os.path.join(os.path.dirname(SUBLIMERL.erl_path), 'ct_run')
+		os_cmd = '%s -noshell -no_auto_compile -pa %s -dir %s -suite %s -logdir %s' % (ct_run_path, ' '.join([self.shellquote(p) for p in code_paths]), self.shellquote(os.path.dirname(suite_path)), suite_name, self.shellquote(log_dir))
+		return self.execute_os_command(os_cmd, block=False, log=False, parser=parser)
+
+	def project_test(self):
+		self.log("Running all Common Tests suites of project \"%s\".\n\n" % self.project_root)
+		# compile all source code, unless nothing changed since the last compile
+		if self.has_stale_ebin_modules() == True: self.compile_source()
+		tasks = []
+		for app_root in self.get_app_roots():
+			suite_paths = self.get_suites(app_root)
+			if len(suite_paths) == 0: continue
+			if self.compile_test_modules(app_root) == False:
+				self.log("\n=> TEST(S) FAILED.\n")
+				self.on_test_ended()
+				return
+			tasks.extend([(app_root, suite_path) for suite_path in suite_paths])
+		# slowest first, so that the workers end at about the same time
+		history = SublimErlTestHistory(self.project_root)
+		tasks.sort(key=lambda task: -history.get_duration(os.path.splitext(os.path.basename(task[1]))[0]))
+		queue = Queue.Queue()
+		for task in tasks: queue.put(task)
+		self.parsers = []
+		lock = threading.Lock()
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				while this.cancelled == False:
+					try:
+						app_root, suite_path = queue.get_nowait()
+					except Queue.Empty:
+						return
+					suite_name = os.path.splitext(os.path.basename(suite_path))[0]
+					start = time.time()
+					parser = SublimErlCtOutputParser(this.show_progress)
+					this.parsers.append(parser)
+					retcode, data = this.run_suite(app_root, suite_path, parser)
+					duration = time.time() - start
+					# ct_run does not end with rebar's DONE, a suite without summary could not be run
+					if parser.summaries == 0: parser.failed += 1
+					lock.acquire()
+					try:
+						history.record(suite_name, duration, 'failed' if parser.failed > 0 else 'passed')
+						if parser.failed > 0: this.log(data)
+						this.log("%s: %d passed, %d failed, %d skipped (%.2fs).\n" % (suite_name, parser.passed, parser.failed, parser.skipped, duration))
+					finally:
+						lock.release()
+		workers = [SublimErlThread() for i in range(min(len(tasks), SUBLIMERL.settings.get('ct_workers', 4)))]
+		for worker in workers: worker.start()
+		for worker in workers: worker.join()
+		history.save()
+		self.counts = self.get_counts()
+		# interpret
+		self.interpret_test_results()
+
+
+# test history report
+class SublimErlTestReport(SublimErlProjectLoader):
+
+	def __init__(self, view):
+		# init super
+		SublimErlProjectLoader.__init__(self, view)
+		self.panel = SublimErlPanel(self.window, 'sublimerl_tests', 'SublimErlTests')
+
+	def log(self, text):
+		self.panel.write(text)
+
+	def show(self):
+		if self.project_root == None: return
+		history = SublimErlTestHistory(self.project_root)
+		self.log("Test report of project \"%s\".\n\n" % self.project_root)
+		self.log("Slowest tests (median duration):\n")
+		for test_id in history.get_slowest_tests(SUBLIMERL.settings.get('test_report_size', 20)):
+			self.log("  %s: %.3fs\n" % (test_id, history.get_duration(test_id)))
+		self.log("\nRegressions (last duration, previous median):\n")
+		for test_id, duration, median in history.get_regressions():
+			self.log("  %s: %.3fs, %.3fs\n" % (test_id, duration, median))
+		self.log("\nFlaky tests (outcome changes in the last runs):\n")
+		for test_id in history.get_flaky_tests():
+			self.log("  %s: %d\n" % (test_id, history.get_flips(test_id)))
+
+
 ### Commands
 # test runners
 class SublimErlTestRunners():
 
-	def dialyzer_test(self, view):
-		test_runner = SublimErlDialyzerTestRunner(view)
-		if test_runner.initialized == False: return
-		test_runner.start_test()
+	def submit(self, view, runner_class, new=True):
+		session = get_view_test_session(view)
+		if session == None:
+			# the runner reports that the view is not part of a project
+			runner_class(view)
+			return
+		session.submit(view, runner_class, new)
+
+	def dialyzer_test(self, view, new=True):
+		self.submit(view, SublimErlDialyzerTestRunner, new)
 
 	def ct_or_eunit_test(self, view, new=True):
-		if SUBLIMERL.last_test_type == 'ct' or SUBLIMERL.get_erlang_module_name(view).find("_SUITE") != -1:
+		session = get_view_test_session(view)
+		module_name = SUBLIMERL.get_erlang_module_name(view)
+		if (new == False and session != None and session.last_test_type == 'ct') or (module_name != None and module_name.find("_SUITE") != -1):
 			# ct
-			test_runner = SublimErlCtTestRunner(view)
+			self.submit(view, SublimErlCtTestRunner, new)
 		else:
 			# eunit
-			test_runner = SublimErlEunitTestRunner(view)
+			self.submit(view, SublimErlEunitTestRunner, new)
+
+	def eunit_project_test(self, view, new=True):
+		self.submit(view, SublimErlEunitProjectTestRunner, new)
 
-		if test_runner.initialized == False: return
-		test_runner.start_test(new=new)
+	def eunit_affected_test(self, view, new=True):
+		self.submit(view, SublimErlEunitAffectedTestRunner, new)
+
+	def ct_project_test(self, view, new=True):
+		self.submit(view, SublimErlCtProjectTestRunner, new)
 
 
 # dialyzer tests
@@ -378,15 +1115,55 @@ class SublimErlTestCommand(SublimErlTextCommand):
 		SublimErlTestRunners().ct_or_eunit_test(self.view)
 
 
-# repeat last test
+# run all eunit tests of the project
+class SublimErlTestProjectCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlTestRunners().eunit_project_test(self.view)
+
+
+# run the eunit tests affected by the changes since the last run without failures
+class SublimErlTestAffectedCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlTestRunners().eunit_affected_test(self.view)
+
+
+# run all CT suites of the project
+class SublimErlCtProjectCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlTestRunners().ct_project_test(self.view)
+
+
+# repeat the last test of the project
 class SublimErlRedoCommand(SublimErlTextCommand):
 	def run_command(self, edit):
-		# init
-		if SUBLIMERL.last_test_type == 'dialyzer': SublimErlTestRunners().dialyzer_test(self.view, new=False)
-		elif SUBLIMERL.last_test_type == 'eunit' or SUBLIMERL.last_test_type == 'ct': SublimErlTestRunners().ct_or_eunit_test(self.view, new=False)
+		session = get_view_test_session(self.view)
+		if session == None: return
+		if session.last_test_type == 'dialyzer': SublimErlTestRunners().dialyzer_test(self.view, new=False)
+		elif session.last_test_type == 'eunit' or session.last_test_type == 'ct': SublimErlTestRunners().ct_or_eunit_test(self.view, new=False)
+		elif session.last_test_type == 'eunit_project': SublimErlTestRunners().eunit_project_test(self.view, new=False)
+		elif session.last_test_type == 'eunit_affected': SublimErlTestRunners().eunit_affected_test(self.view, new=False)
+		elif session.last_test_type == 'ct_project': SublimErlTestRunners().ct_project_test(self.view, new=False)
+
+	def show_contextual_menu(self):
+		session = get_view_test_session(self.view)
+		return session != None and session.last_test != None
+
+
+# cancel the running test of the project, and the queued ones
+class SublimErlTestCancelCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		session = get_view_test_session(self.view)
+		if session != None: session.cancel()
 
 	def show_contextual_menu(self):
-		return SUBLIMERL.last_test != None
+		session = get_view_test_session(self.view)
+		return session != None and session.runner != None
+
+
+# show slow, regressed and flaky tests
+class SublimErlTestReportCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlTestReport(self.view).show()
 
 
 # open CT results
@@ -0,0 +1,96 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+
+# imports
+import sublime
+import os, threading
+from sublimerl_core import SUBLIMERL, SublimErlTextCommand
+from sublimerl_completion import SublimErlIndexes, SUBLIMERL_COMPLETIONS
+from sublimerl_function_search import SublimErlFileOpener
+
+
+# full-text search on the project sources
+class SublimErlTextSearch():
+
+	def __init__(self, view):
+		# init
+		self.view = view
+		self.window = view.window()
+		self.results = []
+
+	def show(self):
+		# query, defaulting to the selection or word under the cursor
+		region = self.view.sel()[0]
+		if region.empty(): region = self.view.word(region)
+		text = self.view.substr(region)
+		if '\n' in text: text = ''
+		self.window.show_input_panel("Text:", text, self.on_query, None, None)
+
+	def on_query(self, query):
+		if len(query) == 0: return
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				this.search(query)
+				sublime.set_timeout(lambda: this.on_searched(query), 0)
+		SublimErlThread().start()
+
+	def search(self, query):
+		# sources and trigrams are bytes
+		if isinstance(query, unicode): query = query.encode('utf-8')
+		# narrow candidates with the trigram index, then verify the matches
+		candidates = SublimErlIndexes().get_trigram_candidates(query)
+		if candidates == None: candidates = SUBLIMERL_COMPLETIONS['current_project']['trigrams'].keys()
+		max_results = SUBLIMERL.settings.get('text_search_max_results', 500)
+		self.results = []
+		for filepath in sorted(candidates):
+			if not os.path.exists(filepath): continue
+			f = open(filepath, 'r')
+			lines = f.readlines()
+			f.close()
+			for i in range(0, len(lines)):
+				if query in lines[i]:
+					self.results.append((filepath, i + 1, lines[i].strip().decode('utf-8', 'replace')))
+					if len(self.results) == max_results: return
+
+	def on_searched(self, query):
+		if len(self.results) > 0:
+			self.window.show_quick_panel([["%s:%d" % (os.path.basename(filepath), lineno), line] for filepath, lineno, line in self.results], self.on_select)
+		else: sublime.status_message("SublimErl: no match for \"%s\"." % query)
+
+	def on_select(self, index):
+		if index == -1: return
+		filepath, lineno, line = self.results[index]
+		SublimErlFileOpener().open(self.window, filepath, lineno)
+
+
+# text search
+class SublimErlTextSearchCommand(SublimErlTextCommand):
+	def run_command(self, edit):
+		SublimErlTextSearch(self.view).show()
@@ -0,0 +1,98 @@
+#!/usr/bin/env escript
+%% -*- erlang -*-
+%%! -smp enable debug verbose
+%% ==========================================================================================================
+%% SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+%%
+%% Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+%% All rights reserved.
+%%
+%% BSD License
+%%
+%% Redistribution and use in source and binary forms, with or without modification, are permitted provided
+%% that the following conditions are met:
+%%
+%%  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+%%        following disclaimer.
+%%  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+%%        the following disclaimer in the documentation and/or other materials provided with the distribution.
+%%  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+%%        products derived from this software without specific prior written permission.
+%%
+%% THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+%% WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+%% PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+%% ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+%% TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+%% HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+%% NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+%% POSSIBILITY OF SUCH DAMAGE.
+%% ==========================================================================================================
+-mode(compile).
+
+% command line exposure: <project root> <app root> <out dir> [-DMacro | +debug_info]... <module path>...
+main([ProjectRoot, AppRoot, OutDir | Args]) ->
+	{Flags, Files} = lists:partition(fun is_flag/1, Args),
+	% rebar resolves relative paths in erl_opts from the app directory
+	ok = file:set_cwd(AppRoot),
+	set_code_paths(ProjectRoot, AppRoot, OutDir),
+	Options = compile_options(ProjectRoot, AppRoot, OutDir, Flags),
+	Results = [compile_file(File, Options) || File <- Files],
+	case lists:all(fun(Result) -> Result =:= ok end, Results) of
+		true -> halt(0);
+		false -> halt(1)
+	end;
+
+main(_) ->
+	halt(1).
+
+is_flag("-D" ++ _) -> true;
+is_flag("+" ++ _) -> true;
+is_flag(_) -> false.
+
+flag_option("-D" ++ Macro) -> {d, list_to_atom(Macro)};
+flag_option("+" ++ Option) -> list_to_atom(Option).
+
+compile_file(File, Options) ->
+	case compile:file(File, Options) of
+		{ok, _Module} -> ok;
+		{ok, _Module, _Warnings} -> ok;
+		_ -> error
+	end.
+
+compile_options(ProjectRoot, AppRoot, OutDir, Flags) ->
+	ErlOpts = [Opt || Opt <- erl_opts(ProjectRoot, AppRoot), not is_platform_define(Opt)],
+	[flag_option(Flag) || Flag <- Flags] ++ ErlOpts ++ [{i, filename:join(AppRoot, "include")}, {outdir, OutDir}, report].
+
+is_platform_define({platform_define, _, _}) -> true;
+is_platform_define({platform_define, _, _, _}) -> true;
+is_platform_define(_) -> false.
+
+erl_opts(ProjectRoot, AppRoot) ->
+	% use the app's own rebar.config, or the project's one if the app has none
+	case rebar_config(AppRoot) of
+		undefined ->
+			case rebar_config(ProjectRoot) of
+				undefined -> [];
+				Config -> proplists:get_value(erl_opts, Config, [])
+			end;
+		Config ->
+			proplists:get_value(erl_opts, Config, [])
+	end.
+
+rebar_config(Dir) ->
+	case file:consult(filename:join(Dir, "rebar.config")) of
+		{ok, Config} -> Config;
+		{error, _} -> undefined
+	end.
+
+set_code_paths(ProjectRoot, AppRoot, OutDir) ->
+	% deps & sibling apps are needed for include_lib, behaviours and parse transforms
+	DepsDir = case rebar_config(ProjectRoot) of
+		undefined -> "deps";
+		Config -> proplists:get_value(deps_dir, Config, "deps")
+	end,
+	Paths = [OutDir, filename:join(AppRoot, "ebin")]
+		++ filelib:wildcard(filename:join([ProjectRoot, DepsDir, "*", "ebin"]))
+		++ filelib:wildcard(filename:join([ProjectRoot, "apps", "*", "ebin"])),
+	code:add_pathsa([Path || Path <- Paths, filelib:is_dir(Path)]).
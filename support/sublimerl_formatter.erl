@@ -40,6 +40,11 @@
 -record(state, {stack = [], tabs = [0], cols = [none]}).
 
 % command line exposure
+main(["server"]) ->
+	% formats sources sent as "<byte size>\n<source>" on stdin, replies "ok <byte size>\n<formatted>" or "error\n"
+	ok = io:setopts(standard_io, [binary, {encoding, latin1}]),
+	serve();
+
 main([FilePath]) ->
 	Lines = read_file(FilePath),
 	Formatted = source_indentation(Lines),
@@ -48,6 +53,39 @@ main([FilePath]) ->
 main(_) ->
 	halt(1).
 
+serve() ->
+	case io:get_line("") of
+		eof ->
+			halt(0);
+		Header ->
+			Size = list_to_integer(string:strip(binary_to_list(Header), right, $\n)),
+			Source = case Size of
+				0 -> <<>>;
+				_ -> io:get_chars("", Size)
+			end,
+			io:put_chars(format_reply(Source)),
+			serve()
+	end.
+
+format_reply(Source) ->
+	try list_to_binary(source_indentation(split_lines(binary_to_list(Source)))) of
+		Formatted -> ["ok ", integer_to_list(byte_size(Formatted)), "\n", Formatted]
+	catch
+		_:_ -> "error\n"
+	end.
+
+split_lines(Source) ->
+	split_lines(Source, [], []).
+
+split_lines([], [], Lines) ->
+	lists:reverse(Lines);
+split_lines([], Line, Lines) ->
+	lists:reverse([lists:reverse(Line) | Lines]);
+split_lines([$\n | Source], Line, Lines) ->
+	split_lines(Source, [], [lists:reverse([$\n | Line]) | Lines]);
+split_lines([C | Source], Line, Lines) ->
+	split_lines(Source, [C | Line], Lines).
+
 read_file(File) ->
     {ok, FileDev} = file:open(File, [raw, read, read_ahead]),
 	Lines = read_file([],FileDev),
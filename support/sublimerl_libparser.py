@@ -26,7 +26,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 # ==========================================================================================================
 
-import sys, re, os, fnmatch, pickle, string, unittest
+import sys, re, os, fnmatch, pickle, cPickle, hashlib, string, unittest
 
 class SublimErlLibParser():
 
@@ -38,7 +38,13 @@ class SublimErlLibParser():
 			'varname': re.compile(r"^[A-Z][a-zA-Z0-9_]*$"),
 			'{': re.compile(r"\{.*\}"),
 			'<<': re.compile(r"<<.*>>"),
-			'[': re.compile(r"\[.*\]")
+			'[': re.compile(r"\[.*\]"),
+			'function_head': re.compile(r"^([a-z][a-zA-Z0-9_]*)\s*\(", re.MULTILINE),
+			'head_end': re.compile(r"\s*(->|when\b)"),
+			'call': re.compile(r"(?:\b([a-z][a-zA-Z0-9_]*)\s*:\s*)?(?<![?#$\w])([a-z][a-zA-Z0-9_]*)\s*(?:(\()|/\s*(\d+))"),
+			'string': re.compile(r"\"(?:[^\"\\]|\\.)*\"", re.DOTALL),
+			'declaration': re.compile(r"^-\s*(?:spec|callback|type|opaque|export|export_type|import|module|record|behaviour|behavior|include|include_lib|file)\b.*?\.(?=\s|$)", re.DOTALL + re.MULTILINE),
+			'arguments': re.compile(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|\$\\?.|<<|>>|[()\[\]{},]|\b(?:case|begin|receive|if|try|end)\b|\bfun(?=\s*\()", re.DOTALL)
 		}
 
 	def strip_comments(self, code):
@@ -50,6 +56,8 @@ class SublimErlLibParser():
 		disasms = {}
 		completions = []
 		searches = []
+		definitions = {}
+		calls = {}
 		# loop directory
 		rel_dirs = []
 		for root, dirnames, filenames in os.walk(starting_dir):
@@ -69,6 +77,10 @@ class SublimErlLibParser():
 						f = open(filepath, 'r')
 						module = self.strip_comments(f.read())
 						f.close()
+						# set definitions
+						definitions[module_name] = (filepath, self.get_definitions(module))
+						# set calls
+						calls[module_name] = (filepath, self.get_calls(module_name, module))
 						# get completions
 						module_completions, line_numbers = self.get_completions(module)
 						if len(module_completions) > 0:
@@ -92,11 +104,21 @@ class SublimErlLibParser():
 			# erlang completions
 			for c in bif_completions['erlang']:
 				completions.append("{ \"trigger\": \"%s\", \"contents\": \"%s\" }" % (c[0], c[1]))
-		else:
-			# we are generating project disasm -> write to files: searches
-			f_searches = open("%s.searches" % dest_file_base, 'wb')
-			pickle.dump(sorted(searches, key=lambda k: k[0]), f_searches)
-			f_searches.close()
+
+		# write to files: searches
+		f_searches = open("%s.searches" % dest_file_base, 'wb')
+		pickle.dump(sorted(searches, key=lambda k: k[0]), f_searches)
+		f_searches.close()
+
+		# write to files: definitions
+		f_definitions = open("%s.definitions" % dest_file_base, 'wb')
+		pickle.dump(definitions, f_definitions)
+		f_definitions.close()
+
+		# write to files: calls
+		f_calls = open("%s.calls" % dest_file_base, 'wb')
+		pickle.dump(calls, f_calls)
+		f_calls.close()
 
 		# write to files: disasms
 		f_disasms = open("%s.disasm" % dest_file_base, 'wb')
@@ -110,6 +132,61 @@ class SublimErlLibParser():
 			f_completions.write("{}")
 		f_completions.close()
 
+	def generate_trigrams(self, starting_dir, dest_file_base):
+		# trigrams of every .erl and .hrl file, only reading the files that changed since the previous run.
+		# the manifest {filepath: (mtime, shard name)} is small, the trigrams of each file are in their own shard
+		# so that readers only load the ones of the files that changed
+		trigrams_filepath = "%s.trigrams" % dest_file_base
+		shards_path = "%s.trigrams.d" % dest_file_base
+		if not os.path.exists(shards_path): os.makedirs(shards_path)
+		previous_files = {}
+		if os.path.exists(trigrams_filepath):
+			f_trigrams = open(trigrams_filepath, 'rb')
+			previous_files = cPickle.load(f_trigrams)
+			f_trigrams.close()
+		# loop directory
+		files = {}
+		for root, dirnames, filenames in os.walk(starting_dir):
+			if '.eunit' in root.split('/'): continue
+			for filename in fnmatch.filter(filenames, r"*.[eh]rl"):
+				filepath = os.path.join(root, filename)
+				mtime = os.path.getmtime(filepath)
+				shard_name = hashlib.sha1(filepath).hexdigest()
+				if previous_files.get(filepath) == (mtime, shard_name) and os.path.exists(os.path.join(shards_path, shard_name)):
+					# unchanged
+					files[filepath] = previous_files[filepath]
+					continue
+				f = open(filepath, 'r')
+				trigrams = self.get_trigrams(f.read())
+				f.close()
+				# write atomically, the editor may be reading it
+				shard_filepath = os.path.join(shards_path, shard_name)
+				f_shard = open("%s.tmp" % shard_filepath, 'wb')
+				f_shard.write(self.encode_trigrams(trigrams))
+				f_shard.close()
+				os.rename("%s.tmp" % shard_filepath, shard_filepath)
+				files[filepath] = (mtime, shard_name)
+		# remove the shards of deleted files
+		shard_names = set([shard_name for mtime, shard_name in files.values()])
+		for shard_name in os.listdir(shards_path):
+			if shard_name not in shard_names: os.remove(os.path.join(shards_path, shard_name))
+		# write manifest
+		f_trigrams = open("%s.tmp" % trigrams_filepath, 'wb')
+		cPickle.dump(files, f_trigrams, cPickle.HIGHEST_PROTOCOL)
+		f_trigrams.close()
+		os.rename("%s.tmp" % trigrams_filepath, trigrams_filepath)
+
+	def get_trigrams(self, text):
+		# all the distinct 3 character sequences in text
+		return frozenset([text[i:i + 3] for i in range(0, len(text) - 2)])
+
+	def encode_trigrams(self, trigrams):
+		# trigrams have a fixed length, they are stored concatenated
+		return ''.join(sorted(trigrams))
+
+	def decode_trigrams(self, data):
+		return frozenset([data[i:i + 3] for i in range(0, len(data), 3)])
+
 	def get_completions(self, module):
 		# get export portion in code module
 
@@ -128,6 +205,59 @@ class SublimErlLibParser():
 		# return all_completions
 		return (all_completions, all_line_numbers)
 
+	def get_definitions(self, module):
+		# line of the first clause of every function defined in module, by (function, arity)
+		definitions = {}
+		for m in self.regex['function_head'].finditer(module):
+			arity, end = self.count_arguments(module, m.end() - 1)
+			# only keep function heads, not calls at the beginning of a line
+			if arity == None or self.regex['head_end'].match(module, end) == None: continue
+			key = (m.group(1), arity)
+			if not definitions.has_key(key): definitions[key] = module.count('\n', 0, m.start()) + 1
+		return definitions
+
+	def get_calls(self, module_name, module):
+		# ((module, function, arity), line) of every call and function reference in module
+		# blank out declarations and the content of strings, keeping the same character count
+		blank = lambda m: re.sub(r"[^\n]", ' ', m.group(0))
+		blank_string = lambda m: m.group(0)[0] + blank(m)[1:-1] + m.group(0)[-1]
+		code = self.regex['declaration'].sub(blank, self.regex['string'].sub(blank_string, module))
+		calls = []
+		for m in self.regex['call'].finditer(code):
+			if m.group(2) in ('after', 'and', 'andalso', 'band', 'begin', 'bnot', 'bor', 'bsl', 'bsr', 'bxor', 'case', 'catch', 'cond', 'div', 'end', 'fun', 'if', 'let', 'not', 'of', 'or', 'orelse', 'query', 'receive', 'rem', 'try', 'when', 'xor'): continue
+			if m.group(1) == None:
+				# remote calls to a variable module cannot be resolved, ?MODULE ones are local
+				preceding = code[max(0, m.start() - 20):m.start()]
+				if re.search(r":\s*$", preceding) != None and re.search(r"\?MODULE\s*:\s*$", preceding) == None: continue
+			if m.group(4) != None:
+				# function reference, only if preceded by fun
+				if re.search(r"\bfun\s*$", code[max(0, m.start() - 20):m.start()]) == None: continue
+				arity = int(m.group(4))
+			else:
+				arity, end = self.count_arguments(code, m.start(3))
+				if arity == None: continue
+				# skip function heads
+				if m.group(1) == None and (m.start() == 0 or code[m.start() - 1] == '\n') and self.regex['head_end'].match(code, end) != None: continue
+			calls.append(((m.group(1) or module_name, m.group(2), arity), code.count('\n', 0, m.start()) + 1))
+		return calls
+
+	def count_arguments(self, code, start):
+		# count the arguments between the parenthesis at start and its closing one, return (arity, end position)
+		depth = 0
+		arguments = 0
+		for m in self.regex['arguments'].finditer(code, start):
+			token = m.group(0)
+			if token in ('(', '[', '{', '<<', 'case', 'begin', 'receive', 'if', 'try', 'fun'):
+				depth += 1
+			elif token in (')', ']', '}', '>>', 'end'):
+				depth -= 1
+				if depth == 0:
+					if len(code[start + 1:m.start()].strip()) == 0: return (0, m.end())
+					return (arguments + 1, m.end())
+			elif token == ',' and depth == 1:
+				arguments += 1
+		return (None, len(code))
+
 	def bif_completions(self):
 		# default BIFs not available in modules
 		return {
@@ -481,6 +611,56 @@ class TestSequenceFunctions(unittest.TestCase):
 			self.assertEqual(self.parser.get_completions(fixtures[f][0]), fixtures[f][1])
 
 
+	def test_get_definitions(self):
+		fixtures = [
+			("""
+-module(test).
+-export([zero/0, one/1]).
+
+zero() -> one(\"a, b\").
+one(<<A, B>>) when is_integer(A) ->
+	lists:map(fun(X) -> X, B end, [A, B]);
+one({A, $,}) -> A.
+
+-spec two(list(), atom()) -> ok.
+two([H | T], {a, b}) ->
+	ok.
+""",
+			{('zero', 0): 5, ('one', 1): 6, ('two', 2): 11}),
+		]
+		for f in range(0, len(fixtures)):
+			self.assertEqual(self.parser.get_definitions(fixtures[f][0]), fixtures[f][1])
+
+	def test_get_calls(self):
+		fixtures = [
+			("""
+-module(test).
+-export([zero/0, one/1]).
+-spec zero() -> ok.
+zero() -> one(\"two(a)\"), lists:map(fun two/1, [1]).
+one({A, B}) when is_integer(A) ->
+	case other:three(A, {B, four()}) of
+		ok -> ?MACRO(A), #rec{a = fun(X) -> X end};
+		_ -> Mod:five(B), ?MODULE:zero()
+	end.
+""",
+			[(('test', 'one', 1), 5), (('lists', 'map', 2), 5), (('test', 'two', 1), 5), (('test', 'is_integer', 1), 6),
+				(('other', 'three', 2), 7), (('test', 'four', 0), 7), (('test', 'zero', 0), 9)]),
+		]
+		for f in range(0, len(fixtures)):
+			self.assertEqual(self.parser.get_calls('test', fixtures[f][0]), fixtures[f][1])
+
+	def test_get_trigrams(self):
+		fixtures = [
+			("ok.", frozenset(["ok."])),
+			("a_b_b", frozenset(["a_b", "_b_", "b_b"])),
+			("ok", frozenset()),
+		]
+		for f in range(0, len(fixtures)):
+			self.assertEqual(self.parser.get_trigrams(fixtures[f][0]), fixtures[f][1])
+			self.assertEqual(self.parser.decode_trigrams(self.parser.encode_trigrams(fixtures[f][1])), fixtures[f][1])
+
+
 if __name__ == '__main__':
 	if (len(sys.argv) == 2):
 		if sys.argv[1] == 'test':
@@ -493,3 +673,9 @@ if __name__ == '__main__':
 		parser = SublimErlLibParser()
 		parser.generate_completions(starting_dir, dest_file_base)
 
+	elif (len(sys.argv) == 4 and sys.argv[1] == 'trigrams'):
+		starting_dir = sys.argv[2]
+		dest_file_base = sys.argv[3]
+		parser = SublimErlLibParser()
+		parser.generate_trigrams(starting_dir, dest_file_base)
+
@@ -0,0 +1,162 @@
+# ==========================================================================================================
+# SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+#
+# Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+# All rights reserved.
+#
+# BSD License
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided
+# that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+#        following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+#        the following disclaimer in the documentation and/or other materials provided with the distribution.
+#  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+#        products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ==========================================================================================================
+
+import sys, os, subprocess, threading, Queue, pickle, hashlib
+
+class SublimErlProjectFormatter():
+
+	def __init__(self, escript_path, project_root, cache_path, workers, check_only):
+		# init
+		self.escript_path = escript_path
+		self.project_root = os.path.abspath(project_root)
+		self.cache_path = cache_path
+		self.workers = workers
+		self.check_only = check_only
+		self.formatter_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sublimerl_formatter.erl')
+
+		self.formatted_hashes = set()
+		self.current_hashes = set()
+		self.unformatted_paths = []
+		self.failed_paths = []
+		self.lock = threading.Lock()
+
+	def run(self):
+		self.load_cache()
+		queue = Queue.Queue()
+		filepaths = self.get_filepaths()
+		for filepath in filepaths: queue.put(filepath)
+		# format in a pool
+		this = self
+		class SublimErlThread(threading.Thread):
+			def run(self):
+				# each worker streams files to its own formatter process
+				process = subprocess.Popen([this.escript_path, this.formatter_path, 'server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+				try:
+					while True:
+						try:
+							filepath = queue.get_nowait()
+						except Queue.Empty:
+							return
+						this.format_file(process, filepath)
+				finally:
+					process.stdin.close()
+					process.wait()
+		threads = [SublimErlThread() for i in range(min(self.workers, len(filepaths)))]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+		self.save_cache()
+		# summary
+		if self.check_only:
+			print "%d file(s) checked, %d not formatted, %d failed." % (len(filepaths), len(self.unformatted_paths), len(self.failed_paths))
+		else:
+			print "%d file(s) checked, %d formatted, %d failed." % (len(filepaths), len(self.unformatted_paths), len(self.failed_paths))
+		if len(self.failed_paths) > 0 or (self.check_only and len(self.unformatted_paths) > 0): return 1
+		return 0
+
+	def get_filepaths(self):
+		# src, include and test directories of the project's apps, deps excluded
+		app_roots = [self.project_root]
+		apps_path = os.path.join(self.project_root, 'apps')
+		if os.path.isdir(apps_path):
+			app_roots.extend([os.path.join(apps_path, name) for name in sorted(os.listdir(apps_path))])
+		filepaths = []
+		for app_root in app_roots:
+			for dirname in ('src', 'include', 'test'):
+				for root, dirnames, filenames in os.walk(os.path.join(app_root, dirname)):
+					for filename in sorted(filenames):
+						if os.path.splitext(filename)[1] in ('.erl', '.hrl'):
+							filepaths.append(os.path.join(root, filename))
+		return filepaths
+
+	def format_file(self, process, filepath):
+		f = open(filepath, 'rb')
+		content = f.read()
+		f.close()
+		content_hash = hashlib.sha1(content).hexdigest()
+		# skip files that are known to be formatted
+		if content_hash in self.formatted_hashes:
+			self.lock.acquire()
+			self.current_hashes.add(content_hash)
+			self.lock.release()
+			return
+		# format
+		process.stdin.write("%d\n%s" % (len(content), content))
+		process.stdin.flush()
+		header = process.stdout.readline()
+		formatted = None
+		if header.startswith('ok '): formatted = process.stdout.read(int(header[3:]))
+		self.lock.acquire()
+		try:
+			if formatted == None:
+				self.failed_paths.append(filepath)
+				print "failed: %s" % filepath
+			elif formatted == content:
+				self.current_hashes.add(content_hash)
+			elif self.check_only:
+				self.unformatted_paths.append(filepath)
+				print "not formatted: %s" % filepath
+			else:
+				f = open(filepath, 'wb')
+				f.write(formatted)
+				f.close()
+				self.current_hashes.add(hashlib.sha1(formatted).hexdigest())
+				self.unformatted_paths.append(filepath)
+				print "formatted: %s" % filepath
+			sys.stdout.flush()
+		finally:
+			self.lock.release()
+
+	def get_formatter_hash(self):
+		# cached hashes are only valid for the formatter that produced them
+		f = open(self.formatter_path, 'rb')
+		formatter_hash = hashlib.sha1(f.read()).hexdigest()
+		f.close()
+		return formatter_hash
+
+	def load_cache(self):
+		if not os.path.exists(self.cache_path): return
+		f = open(self.cache_path, 'rb')
+		cache = pickle.load(f)
+		f.close()
+		if cache['formatter'] == self.get_formatter_hash(): self.formatted_hashes = cache['hashes']
+
+	def save_cache(self):
+		if not os.path.exists(os.path.dirname(self.cache_path)): os.makedirs(os.path.dirname(self.cache_path))
+		f = open(self.cache_path, 'wb')
+		# only keep the hashes of the current files
+		pickle.dump({'formatter': self.get_formatter_hash(), 'hashes': self.current_hashes}, f)
+		f.close()
+
+
+if __name__ == '__main__':
+	# usage: sublimerl_project_formatter.py <escript path> <project root> <cache file> <workers> [check]
+	if len(sys.argv) in (5, 6):
+		formatter = SublimErlProjectFormatter(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]), len(sys.argv) == 6 and sys.argv[5] == 'check')
+		sys.exit(formatter.run())
+	else:
+		sys.exit(2)
@@ -0,0 +1,94 @@
+#!/usr/bin/env escript
+%% -*- erlang -*-
+%%! -smp enable debug verbose
+%% ==========================================================================================================
+%% SublimErl - A Sublime Text 2 Plugin for Erlang Integrated Testing & Code Completion
+%%
+%% Copyright (C) 2013, Roberto Ostinelli <roberto@ostinelli.net>.
+%% All rights reserved.
+%%
+%% BSD License
+%%
+%% Redistribution and use in source and binary forms, with or without modification, are permitted provided
+%% that the following conditions are met:
+%%
+%%  * Redistributions of source code must retain the above copyright notice, this list of conditions and the
+%%        following disclaimer.
+%%  * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and
+%%        the following disclaimer in the documentation and/or other materials provided with the distribution.
+%%  * Neither the name of the authors nor the names of its contributors may be used to endorse or promote
+%%        products derived from this software without specific prior written permission.
+%%
+%% THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED
+%% WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+%% PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+%% ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+%% TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+%% HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+%% NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+%% POSSIBILITY OF SUCH DAMAGE.
+%% ==========================================================================================================
+-mode(compile).
+
+% command line exposure: <project root> <app root>
+% runs the eunit tests requested on stdin as "<module> [<function>]" lines, after loading the beams of .eunit that changed
+main([ProjectRoot, AppRoot]) ->
+	EunitDir = filename:join(AppRoot, ".eunit"),
+	% rebar runs eunit from the .eunit directory
+	ok = filelib:ensure_dir(filename:join(EunitDir, "dummy")),
+	ok = file:set_cwd(EunitDir),
+	set_code_paths(ProjectRoot, AppRoot, EunitDir),
+	serve(EunitDir, dict:new());
+
+main(_) ->
+	halt(1).
+
+serve(EunitDir, Beams) ->
+	case io:get_line("") of
+		eof ->
+			halt(0);
+		Line ->
+			Beams1 = load_changed_beams(EunitDir, Beams),
+			Result = run_tests(string:tokens(string:strip(Line, right, $\n), " ")),
+			% end of the output of this run
+			io:format("~nsublimerl_test_server ~p~n", [Result]),
+			serve(EunitDir, Beams1)
+	end.
+
+load_changed_beams(EunitDir, Beams) ->
+	lists:foldl(fun(File, Acc) ->
+		{ok, Binary} = file:read_file(File),
+		Md5 = erlang:md5(Binary),
+		case dict:find(File, Acc) of
+			{ok, Md5} ->
+				Acc;
+			_ ->
+				Module = list_to_atom(filename:basename(File, ".beam")),
+				code:purge(Module),
+				case code:load_binary(Module, File, Binary) of
+					{module, Module} -> dict:store(File, Md5, Acc);
+					{error, _} -> Acc
+				end
+		end
+	end, Beams, filelib:wildcard(filename:join(EunitDir, "*.beam"))).
+
+run_tests([Module]) ->
+	eunit:test({module, list_to_atom(Module)}, [verbose]);
+run_tests([Module, Function]) ->
+	% generators end in _test_
+	case lists:suffix("_test_", Function) of
+		true -> eunit:test({generator, list_to_atom(Module), list_to_atom(Function)}, [verbose]);
+		false -> eunit:test({list_to_atom(Module), list_to_atom(Function)}, [verbose])
+	end;
+run_tests(_) ->
+	error.
+
+set_code_paths(ProjectRoot, AppRoot, EunitDir) ->
+	DepsDir = case file:consult(filename:join(ProjectRoot, "rebar.config")) of
+		{ok, Config} -> proplists:get_value(deps_dir, Config, "deps");
+		{error, _} -> "deps"
+	end,
+	Paths = [EunitDir, filename:join(AppRoot, "ebin")]
+		++ filelib:wildcard(filename:join([ProjectRoot, DepsDir, "*", "ebin"]))
+		++ filelib:wildcard(filename:join([ProjectRoot, "apps", "*", "ebin"])),
+	code:add_pathsa([Path || Path <- Paths, filelib:is_dir(Path)]).